@@ -0,0 +1,83 @@
+"""
+Benchmark for what loading the plugin costs a Neovim session once the
+python3 remote plugin host has started.
+
+Whether the host starts at all isn't measured here. The plugin's remote
+autocmds only match *.hs buffers, and plugin/stack_ide.vim only calls into
+the host from VimEnter inside a stack project. A session which opens no
+Haskell file outside a stack project never starts the host for this
+plugin, and pays nothing. Where the host does start, for this plugin or
+another, it imports the stack_ide package. Each case below is timed in a
+fresh interpreter, as the host would import it:
+
+    neovim    the client library alone, which the host has loaded anyway
+    entry     neovim plus stack_ide, what every host start pays for it
+    plugin    entry plus stack_ide.plugin, i.e. the first Haskell buffer
+
+The entry case should cost no more than neovim alone, and load no stack_ide
+modules but the package itself. None of this includes the host's own
+startup, which a Haskell buffer or stack project needs anyway.
+
+    python bench/bench_import.py [--repeat N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+RPLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rplugin", "python3")
+
+CASES = [
+        ("neovim", "import neovim"),
+        ("entry", "import neovim; import stack_ide"),
+        ("plugin", "import neovim; import stack_ide; import stack_ide.plugin")
+        ]
+
+SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+{0}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "modules": sorted(m for m in sys.modules if m == "stack_ide" or m.startswith("stack_ide.")),
+    "module_count": len(sys.modules)
+    }}))
+"""
+
+
+def run_case(statement):
+    output = subprocess.check_output([sys.executable, "-c", SCRIPT.format(statement)],
+            cwd=RPLUGIN_DIR)
+    return json.loads(output.decode("UTF-8"))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv[1:])
+
+    try:
+        subprocess.check_output([sys.executable, "-c", "import neovim"], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError:
+        sys.stderr.write("The neovim python client isn't installed for {0}\n".format(sys.executable))
+        return 1
+
+    medians = {}
+    for (name, statement) in CASES:
+        runs = [run_case(statement) for _ in range(args.repeat)]
+        medians[name] = statistics.median(run["seconds"] for run in runs)
+        print("{0:8} median {1:7.2f} ms, min {2:7.2f} ms, {3} modules; stack_ide: {4}".format(
+            name, medians[name] * 1000, min(run["seconds"] for run in runs) * 1000,
+            runs[-1]["module_count"], ", ".join(runs[-1]["modules"]) or "-"))
+
+    print("stack_ide at host start: {0:+.2f} ms; deferred to the first Haskell buffer: {1:.2f} ms".format(
+        (medians["entry"] - medians["neovim"]) * 1000, (medians["plugin"] - medians["entry"]) * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,113 @@
+"""
+Microbenchmark for reading and parsing stack-ide's newline separated JSON.
+
+Compares the old path (readline, decode to str, json.loads) with the
+chunked LineFramer feeding each available JsonCodec, over a stream holding
+many small responses and a few multi-megabyte ones.
+
+    python bench/bench_json_framing.py [--errors N] [--small N] [--repeat N]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rplugin", "python3", "stack_ide"))
+
+from codec import json_codec, _CODECS
+from framing import LineFramer
+
+
+READ_SIZE = 256 * 1024
+
+
+def source_errors_response(count):
+    span = {"spanFilePath": "src/Some/Module/Name.hs", "spanFromLine": 10,
+            "spanFromColumn": 5, "spanToLine": 10, "spanToColumn": 17}
+    error = {"errorKind": "KindWarning", "errorSpan": {"tag": "ProperSpan", "contents": span},
+             "errorMsg": "Defined but not used: ‘someBinding’\n" * 3}
+    return {"tag": "ResponseGetSourceErrors", "seq": "1", "contents": [error] * count}
+
+
+def exp_types_response():
+    span = {"spanFilePath": "src/A.hs", "spanFromLine": 1, "spanFromColumn": 1,
+            "spanToLine": 1, "spanToColumn": 9}
+    return {"tag": "ResponseGetExpTypes", "seq": "2", "contents": [["Maybe Int", span]] * 4}
+
+
+def make_stream(errors, small):
+    lines = [json.dumps(exp_types_response())] * small
+    big = json.dumps(source_errors_response(errors))
+    lines[::max(1, small // 4)] = [big] * len(lines[::max(1, small // 4)])
+    return ("\n".join(lines) + "\n").encode("UTF-8")
+
+
+def readline_json(data):
+    stream = io.BufferedReader(io.BytesIO(data))
+    count = 0
+    while True:
+        line = stream.readline().decode("UTF-8")
+        if not line:
+            break
+        json.loads(line)
+        count += 1
+    return count
+
+
+def framed(codec):
+    def run(data):
+        stream = io.BufferedReader(io.BytesIO(data))
+        framer = LineFramer()
+        count = 0
+        while True:
+            chunk = stream.read1(READ_SIZE)
+            lines = framer.feed(chunk) if chunk else framer.flush()
+            for line in lines:
+                codec.loads(line)
+                count += 1
+            if not chunk:
+                break
+        return count
+    return run
+
+
+def best_of(fn, data, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--errors", type=int, default=20000,
+            help="source errors in each large response")
+    parser.add_argument("--small", type=int, default=2000, help="number of responses")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv[1:])
+
+    data = make_stream(args.errors, args.small)
+    print("stream: {0:.1f} MB in {1} lines".format(len(data) / 2**20, data.count(b"\n")))
+
+    variants = [("readline + str + json", readline_json)]
+    seen = set()
+    for name in _CODECS:
+        codec = json_codec(name)
+        if codec.name not in seen:
+            seen.add(codec.name)
+            variants.append(("framed bytes + {0}".format(codec.name), framed(codec)))
+
+    baseline = None
+    for (name, fn) in variants:
+        elapsed = best_of(fn, data, args.repeat)
+        baseline = baseline or elapsed
+        print("{0:<28} {1:8.1f} ms  {2:6.1f} MB/s  x{3:.2f}".format(
+            name, elapsed * 1000, len(data) / 2**20 / elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
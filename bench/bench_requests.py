@@ -0,0 +1,124 @@
+"""
+Benchmark the request/response path against the fake stack-ide server.
+
+Drives StackIdeApi -> Session -> AsyncSession -> JsonStream -> Process with
+--concurrency clients, each keeping one request in flight, and reports
+throughput, client-side latency percentiles, the session's own RequestStats
+and memory use.
+
+    python bench/bench_requests.py [--requests N] [--concurrency N]
+        [--mix exp-types,span-info,source-errors,loaded-modules]
+        [--scale N] [--delay-ms MS] [--trace-memory] [--json FILE]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "rplugin", "python3", "stack_ide"))
+
+from common import DebugLog, Histogram, Process, SourceSpan, api_for_process, format_summary
+
+
+def issue(api, kind, client, i):
+    # Each client queries its own file so coalescing never cancels a query.
+    source_span = SourceSpan("src/Bench{0}.hs".format(client), 1 + i % 500, 1 + i % 500, 5, 6)
+    handler = lambda tag, contents: 'done'
+    if kind == "exp-types":
+        return api.get_exp_types(source_span, handler)
+    if kind == "span-info":
+        return api.get_span_info(source_span, handler)
+    if kind == "source-errors":
+        return api.get_source_errors(handler)
+    return api.get_loaded_modules(handler)
+
+
+def client(api, kinds, client_id, count, latencies, errors):
+    for i in range(count):
+        started = time.perf_counter()
+        try:
+            issue(api, kinds[i % len(kinds)], client_id, i).result(60)
+        except Exception as exc:
+            errors.append(repr(exc))
+            continue
+        latencies.add(time.perf_counter() - started)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", default="exp-types,span-info")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--delay-ms", type=float, default=0)
+    parser.add_argument("--trace-memory", action="store_true",
+            help="report peak Python allocations (slows everything down)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv[1:])
+
+    kinds = args.mix.split(",")
+    if args.trace_memory:
+        tracemalloc.start()
+    process = Process(
+            name="fake stack ide",
+            process_args=[sys.executable, os.path.join(HERE, "fake_stack_ide.py"),
+                          "--scale", str(args.scale), "--delay-ms", str(args.delay_ms)],
+            cwd=HERE,
+            debug=DebugLog())
+    ready = threading.Event()
+
+    def default_handler(tag, contents):
+        if tag == "ResponseUpdateSession" and contents.get("tag") == "UpdateStatusDone":
+            ready.set()
+
+    api = api_for_process(process, default_handler, DebugLog())
+    ready.wait(30)
+
+    latencies = Histogram(args.requests)
+    errors = []
+    per_client = args.requests // args.concurrency
+    threads = [threading.Thread(target=client, args=(api, kinds, c, per_client, latencies, errors))
+               for c in range(args.concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    results = {
+            "requests": latencies.count,
+            "errors": len(errors),
+            "seconds": elapsed,
+            "throughput": latencies.count / elapsed,
+            "latency": latencies.summary(),
+            "python_peak_bytes": peak,
+            "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "session": api.stats()
+            }
+    api.end()
+
+    print("{requests} requests ({errors} errors) in {seconds:.2f}s: {throughput:.0f} req/s".format(**results))
+    print("latency: {0}".format(format_summary(results["latency"])))
+    for (name, summary) in sorted(results["session"]["timings"].items()):
+        print("{0}: {1}".format(name, format_summary(summary)))
+    for (tag, request) in sorted(results["session"]["requests"].items()):
+        print("{0}: {1}".format(tag, format_summary(request["latency"])))
+    print("max RSS {0:.1f} MB".format(results["max_rss_bytes"] / 2**20))
+    if peak is not None:
+        print("python peak {0:.1f} MB".format(peak / 2**20))
+    if errors:
+        print("first error: {0}".format(errors[0]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
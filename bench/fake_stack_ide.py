@@ -0,0 +1,137 @@
+"""
+Stand-in for `stack ide start` speaking the same newline separated JSON.
+
+Answers each request with a canned response whose size grows with --scale,
+after a configurable delay, one request at a time as stack-ide does. Used by
+the benchmarks to measure the plugin's own overhead without GHC.
+
+    python bench/fake_stack_ide.py [--scale N] [--delay-ms MS] [--update-steps N]
+"""
+import argparse
+import json
+import sys
+import time
+
+
+def span(file_path, from_line, from_column, to_line, to_column):
+    return {"spanFilePath": file_path, "spanFromLine": from_line,
+            "spanFromColumn": from_column, "spanToLine": to_line,
+            "spanToColumn": to_column}
+
+
+class FakeStackIde(object):
+    def __init__(self, out, scale, delay, update_steps, update_delay):
+        self._out = out
+        self._scale = scale
+        self._delay = delay
+        self._update_steps = update_steps
+        self._update_delay = update_delay
+
+
+    def run(self, lines):
+        self._write({"tag": "ResponseWelcome", "contents": [0, 1, 1]})
+        self._update_session(None)
+        for line in lines:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                continue
+            tag = request.get("tag")
+            if tag == "RequestShutdownSession":
+                break
+            if self._delay:
+                time.sleep(self._delay)
+            handler = getattr(self, "_" + tag, None)
+            if handler is None:
+                self._write({"tag": "ResponseInvalidRequest", "seq": request.get("seq"),
+                             "contents": "Unknown request {0}".format(tag)})
+            else:
+                handler(request.get("seq"), request.get("contents"))
+
+
+    def _write(self, msg):
+        self._out.write(json.dumps(msg) + "\n")
+        self._out.flush()
+
+
+    def _update_session(self, seq):
+        for step in range(1, self._update_steps + 1):
+            if self._update_delay:
+                time.sleep(self._update_delay)
+            progress = {"progressStep": step, "progressNumSteps": self._update_steps,
+                        "progressParsedMsg": "Compiling Module{0}".format(step),
+                        "progressOrigMsg": None}
+            self._write({"tag": "ResponseUpdateSession", "seq": seq,
+                         "contents": {"tag": "UpdateStatusProgress", "contents": progress}})
+        self._write({"tag": "ResponseUpdateSession", "seq": seq,
+                     "contents": {"tag": "UpdateStatusDone", "contents": []}})
+
+
+    def _RequestUpdateSession(self, seq, contents):
+        self._update_session(seq)
+
+
+    def _RequestGetExpTypes(self, seq, s):
+        # Enclosing expressions of the queried position, innermost first.
+        types = []
+        for i in range(4 * self._scale):
+            types.append(["Maybe (Either String Int{0})".format(i),
+                          span(s["spanFilePath"], max(1, s["spanFromLine"] - i),
+                               max(1, s["spanFromColumn"] - i), s["spanToLine"] + i,
+                               s["spanToColumn"] + i)])
+        self._write({"tag": "ResponseGetExpTypes", "seq": seq, "contents": types})
+
+
+    def _RequestGetSpanInfo(self, seq, s):
+        info = {"tag": "SpanId", "contents": {
+            "idProp": {
+                "idName": "fromMaybe",
+                "idSpace": "VarName",
+                "idType": "a -> Maybe a -> a",
+                "idDefinedIn": {"moduleName": "Data.Maybe",
+                                "modulePackage": {"packageName": "base",
+                                                  "packageVersion": "4.8.1.0",
+                                                  "packageKey": "base"}},
+                "idDefSpan": {"tag": "ProperSpan",
+                              "contents": span("src/Data/Maybe.hs", 10, 1, 10, 10)},
+                "idHomeModule": None},
+            "idScope": {"tag": "Imported"}}}
+        self._write({"tag": "ResponseGetSpanInfo", "seq": seq,
+                     "contents": [[info, s]] * self._scale})
+
+
+    def _RequestGetSourceErrors(self, seq, contents):
+        errors = []
+        for i in range(100 * self._scale):
+            errors.append({
+                "errorKind": "KindWarning" if i % 4 else "KindError",
+                "errorSpan": {"tag": "ProperSpan",
+                              "contents": span("src/Module{0}.hs".format(i % 50), i + 1, 1, i + 1, 12)},
+                "errorMsg": "Defined but not used: ‘binding{0}’".format(i)})
+        self._write({"tag": "ResponseGetSourceErrors", "seq": seq, "contents": errors})
+
+
+    def _RequestGetLoadedModules(self, seq, contents):
+        modules = ["Module{0}".format(i) for i in range(10 * self._scale)]
+        self._write({"tag": "ResponseGetLoadedModules", "seq": seq, "contents": modules})
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Fake stack-ide server")
+    parser.add_argument("--scale", type=int, default=1,
+            help="multiplier for response sizes")
+    parser.add_argument("--delay-ms", type=float, default=0,
+            help="delay before answering each request")
+    parser.add_argument("--update-steps", type=int, default=3,
+            help="progress messages per session update")
+    parser.add_argument("--update-delay-ms", type=float, default=0,
+            help="delay before each progress message")
+    args = parser.parse_args(argv[1:])
+
+    server = FakeStackIde(sys.stdout, args.scale, args.delay_ms / 1000.0,
+            args.update_steps, args.update_delay_ms / 1000.0)
+    server.run(sys.stdin)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,38 @@
+" Autocmds which match every Neovim session live here rather than in the
+" remote plugin: a remote autocmd starts the python3 host the first time it
+" fires, and these only call into the host once it's worth it.
+
+if exists('g:loaded_stack_ide')
+  finish
+endif
+let g:loaded_stack_ide = 1
+
+" Start a stack-ide session for the stack project Neovim is working in, if
+" any, so that it has loaded by the time the first buffer needs it.
+function! s:prewarm() abort
+  if !get(g:, 'stack_ide_prewarm', 1) || !exists('*StackIdePrewarm')
+    return
+  endif
+  if empty(findfile('stack.yaml', escape(getcwd(), ' ,;') . ';'))
+    return
+  endif
+  call StackIdePrewarm(getcwd())
+endfunction
+
+" End the stack-ide sessions, if the host has been started at all.
+function! s:shutdown() abort
+  try
+    let l:running = remote#host#IsRunning('python3')
+  catch
+    let l:running = 0
+  endtry
+  if l:running && exists('*StackIdeShutdown')
+    call StackIdeShutdown()
+  endif
+endfunction
+
+augroup stack_ide
+  autocmd!
+  autocmd VimEnter,DirChanged * call s:prewarm()
+  autocmd VimLeavePre * call s:shutdown()
+augroup END
@@ -1,20 +1,422 @@
+import collections
+import concurrent.futures
+import threading
+
+try:
+    from stack_ide.cache import LruCache
+    from stack_ide.coalesce import Coalescer
+    from stack_ide.identifiers import IdentifierIndex, compiled_module
+    from stack_ide.span_index import SpanIndex
+except ImportError:
+    from cache import LruCache
+    from coalesce import Coalescer
+    from identifiers import IdentifierIndex, compiled_module
+    from span_index import SpanIndex
+
+
 class StackIdeApi(object):
     """
     API for making requests to a stack-ide process.
+
+    Every request returns a future (see Session.send_request); nothing here
+    blocks waiting for stack-ide.
+
+    Responses to span queries are cached by span and buffer changedtick, so
+    moving the cursor back to a position already queried is answered without
+    a round trip. The cache is dropped whenever stack-ide finishes updating
+    its session.
+
+    Expression types are also kept in a per-file SpanIndex, which answers
+    queries at positions already queried for as long as the buffer is
+    unchanged, unlike the size bounded cache. Likewise span info is kept in
+    an IdentifierIndex, which also serves go-to-definition and lookups by
+    name. The IdentifierIndex outlives session updates: only what depends
+    on the modules recompiled is dropped.
+
+    Span queries are also coalesced per request tag and file: a new query
+    supersedes any query of the same kind still in flight for that file, and
+    the superseded response never reaches its handler.
+
+    The latest update sent for each source file is remembered and sent again
+    if the stack-ide process is restarted.
+
+    While the session warms up (see warm_up) span queries are held back,
+    latest per request tag and file, and sent once stack-ide has loaded.
+    Queries the indexes can answer are answered even then.
+
+    With a ResultStore attached, the indexes' results for files whose
+    buffers match the file on disk (see file_loaded) are kept in it, and
+    restored into the indexes when such a file is next loaded, so a
+    reopened project answers before stack-ide has finished loading it.
     """
+    SPAN_QUERY_CACHE_SIZE = 512
+
     def __init__(self, stack_ide_session):
         self._session = stack_ide_session
+        self._span_query_cache = LruCache(self.SPAN_QUERY_CACHE_SIZE)
+        self._exp_types_index = SpanIndex()
+        self._identifiers = IdentifierIndex()
+        # Modules compiled by the session update in progress; None if one
+        # couldn't be told from its progress message.
+        self._compiled_modules = set()
+        self._coalescer = Coalescer(self.send_request)
+        self._update_listeners = []
+        # file path to its latest session update
+        self._session_state = collections.OrderedDict()
+        self._session.add_restart_listener(self._resend_session_state)
+        self._warming_up = False
+        # coalesce key to (send, future) for queries held back during warm up
+        self._deferred = collections.OrderedDict()
+        self._deferred_lock = threading.Lock()
+        self._store = None
+        # file path to (changedtick, content hash) of buffers which were
+        # last read or written at changedtick
+        self._clean_files = {}
+
+
+    def get_exp_types(self, source_span, handler, changedtick=None):
+        return self._send_span_query("RequestGetExpTypes", source_span, handler, changedtick)
+
+
+    def get_span_info(self, source_span, handler, changedtick=None):
+        return self._send_span_query("RequestGetSpanInfo", source_span, handler, changedtick)
+
+
+    def get_definition(self, source_span, handler, changedtick=None):
+        """
+        Call handler with the IdInfo of the identifier at source_span, or
+        None if there is none, asking stack-ide only if it isn't known.
+        """
+        if changedtick is not None:
+            id_info = self._identifiers.definition_at(source_span.file_path,
+                    source_span.from_line, source_span.from_column, changedtick)
+            if id_info is not None:
+                return self._answer_from_cache(("IdInfo", id_info), lambda tag, info: handler(info))
+
+        def on_span_info(tag, infos):
+            id_info = None
+            if tag == "ResponseGetSpanInfo":
+                id_info = next((info.id_info for info in infos if info.id_info is not None), None)
+            return handler(id_info)
+        return self.get_span_info(source_span, on_span_info, changedtick)
+
+
+    def find_identifier(self, name, module=None):
+        """
+        Return the IdInfo of each identifier called name that stack-ide has
+        described so far. Never makes a request.
+        """
+        return self._identifiers.find(name, module)
+
+
+    def get_source_errors(self, handler=None):
+        return self.send_request("RequestGetSourceErrors", [], handler)
+
 
+    def get_loaded_modules(self, handler=None):
+        return self.send_request("RequestGetLoadedModules", [], handler)
 
-    def get_exp_types(self, source_span, handler):
-        self.send_request("RequestGetExpTypes", source_span, handler)
 
+    def update_session(self, updates, handler=None):
+        """
+        Send a RequestUpdateSession with the given list of session updates,
+        e.g. RequestUpdateSourceFile. Progress is reported to handler.
+        """
+        self._remember_updates(updates)
+        return self.send_request("RequestUpdateSession", updates, handler)
 
-    def get_span_info(self, source_span, handler):
-        self.send_request("RequestGetSpanInfo", source_span, handler)
+
+    def warm_up(self, handler=None):
+        """
+        Ask stack-ide to load its targets, holding back span queries until
+        it has finished. Progress is reported to handler.
+        """
+        with self._deferred_lock:
+            self._warming_up = True
+        future = self.update_session([], handler)
+        future.add_done_callback(lambda _future: self._end_warm_up())
+        return future
 
 
     def send_request(self, tag, contents=None, handler=None):
+        return self._session.send_request(
+                tag, self._encode_contents(contents), self.wrap_handler(handler))
+
+
+    def send_request_sync(self, tag, contents=None, handler=None, timeout=None):
+        """
+        Send a request and block until it has completed.
+
+        This is meant for scripts such as cli.py. It must not be used from
+        Neovim's RPC thread, as the responses are delivered on another thread
+        which may in turn need the RPC thread to apply them.
+        """
+        return self.send_request(tag, contents, handler).result(timeout)
+
+
+    def wrap_handler(self, handler):
+        """
+        Return a handler which lets this API observe each response before
+        passing it on to handler.
+
+        Without a handler the final ``[tag, contents]`` is returned, matching
+        Session.send_request; session update progress is passed over.
+        """
+        def observe(tag, contents):
+            self._observe_response(tag, contents)
+            if handler is None:
+                if _is_update_progress(tag, contents):
+                    return 'partial'
+                return [tag, contents]
+            return handler(tag, contents)
+        return observe
+
+
+    @property
+    def pid(self):
+        return self._session.pid
+
+
+    def pending_count(self):
+        return self._session.pending_count()
+
+
+    def is_idle(self):
+        return self.pending_count() == 0
+
+
+    def is_alive(self):
+        """
+        False once stack-ide has died and won't be restarted.
+        """
+        return self._session.is_alive()
+
+
+    def end(self):
+        """
+        Ask stack-ide to shut down, saving results to the store, if any.
+        """
+        self.persist()
+        self._session.end()
+
+
+    def attach_store(self, store):
+        """
+        Keep results in a ResultStore between sessions.
+        """
+        self._store = store
+
+
+    def file_loaded(self, file_path, changedtick, content_hash):
+        """
+        Note that file_path's buffer matched the file on disk, hashing to
+        content_hash, at changedtick, i.e. it has just been read or written.
+        Results stored for those contents are restored into the indexes.
+        """
+        if content_hash is None:
+            self._clean_files.pop(file_path, None)
+            return
+        self._clean_files[file_path] = (changedtick, content_hash)
+        if self._store is None:
+            return
+        results = self._store.lookup(file_path, content_hash)
+        if results is not None:
+            (exp_types, span_infos) = results
+            self._exp_types_index.restore(file_path, changedtick, exp_types)
+            self._identifiers.add_span_info(file_path, changedtick, span_infos)
+
+
+    def persist(self):
+        """
+        Save the results for files matching their contents on disk to the
+        store, if any.
+        """
+        self._keep_results()
+        if self._store is not None:
+            self._store.save()
+
+
+    def add_update_listener(self, listener):
+        """
+        Call listener with no arguments each time stack-ide finishes
+        updating its session. Listeners run on the session's reader thread.
+        """
+        self._update_listeners.append(listener)
+
+
+    def cache_stats(self):
+        return self._span_query_cache.stats()
+
+
+    def coalescing_stats(self):
+        return self._coalescer.stats()
+
+
+    def stats(self):
+        """
+        Return request latency, traffic, cache, coalescing and scheduling
+        statistics as a JSON serialisable dict.
+        """
+        stats = self._session.stats.snapshot()
+        stats["pending"] = self.pending_count()
+        stats["cache"] = self.cache_stats()
+        stats["coalescing"] = self.coalescing_stats()
+        stats["scheduler"] = self._session.scheduler_stats()
+        stats["identifiers"] = self._identifiers.stats()
+        if self._store is not None:
+            stats["store"] = self._store.stats()
+        return stats
+
+
+    def _send_span_query(self, tag, source_span, handler, changedtick):
+        coalesce_key = (tag, source_span.file_path)
+        key = (tag, source_span, changedtick)
+        cached = self._local_answer(key) if changedtick is not None else None
+        if cached is not None:
+            # The local answer is newer than anything still in flight.
+            self._coalescer.supersede(coalesce_key)
+            return self._answer_from_cache(cached, handler)
+
+        deferred = self._defer_while_warming_up(coalesce_key,
+                lambda: self._send_span_query(tag, source_span, handler, changedtick))
+        if deferred is not None:
+            return deferred
+        if changedtick is None:
+            return self._coalescer.send_request(coalesce_key, tag, source_span, handler)
+
+        def cache_response(resp_tag, contents):
+            # Superseded responses are still good answers for their own span.
+            if resp_tag == "ResponseInvalidRequest":
+                return
+            self._span_query_cache.put(key, (resp_tag, contents))
+            if resp_tag == "ResponseGetExpTypes" and _is_position(source_span):
+                self._exp_types_index.add(source_span.file_path, changedtick, source_span.start,
+                        contents)
+            elif resp_tag == "ResponseGetSpanInfo":
+                self._identifiers.add_span_info(source_span.file_path, changedtick, contents)
+
+        return self._coalescer.send_request(
+                coalesce_key, tag, source_span, handler, observer=cache_response)
+
+
+    def _local_answer(self, key):
+        """
+        Return [tag, contents] answering a span query from the cache or the
+        indexes, or None.
+        """
+        (tag, source_span, changedtick) = key
+        cached = self._span_query_cache.get(key)
+        if cached is None and tag == "RequestGetExpTypes" and _is_position(source_span):
+            types = self._exp_types_index.lookup(source_span.file_path,
+                    source_span.from_line, source_span.from_column, changedtick)
+            if types is not None:
+                cached = ("ResponseGetExpTypes", types)
+        elif cached is None and tag == "RequestGetSpanInfo":
+            infos = self._identifiers.lookup(source_span.file_path,
+                    source_span.from_line, source_span.from_column, changedtick)
+            if infos is not None:
+                cached = ("ResponseGetSpanInfo", infos)
+        return cached
+
+
+    def _defer_while_warming_up(self, coalesce_key, send):
+        """
+        Return a future for send() to be called once warm up has finished,
+        or None if the session is already warm.
+        """
+        with self._deferred_lock:
+            if not self._warming_up:
+                return None
+            future = concurrent.futures.Future()
+            previous = self._deferred.pop(coalesce_key, None)
+            self._deferred[coalesce_key] = (send, future)
+        if previous is not None:
+            previous[1].cancel()
+        return future
+
+
+    def _end_warm_up(self):
+        with self._deferred_lock:
+            self._warming_up = False
+            deferred = list(self._deferred.values())
+            self._deferred.clear()
+        for (send, future) in deferred:
+            if not future.cancelled():
+                _chain_future(send(), future)
+
+
+    def _answer_from_cache(self, cached, handler):
+        future = concurrent.futures.Future()
+        [tag, contents] = cached
+        try:
+            future.set_result(handler(tag, contents))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+    def _observe_response(self, tag, contents):
+        if tag == "ResponseGetLoadedModules":
+            self._identifiers.set_loaded_modules(contents)
+        elif tag == "ResponseUpdateSession" and isinstance(contents, dict):
+            if _is_update_progress(tag, contents):
+                module = compiled_module(contents.get("contents") or {})
+                if module is None:
+                    self._compiled_modules = None
+                elif self._compiled_modules is not None:
+                    self._compiled_modules.add(module)
+            elif contents.get("tag") == "UpdateStatusDone":
+                # stack-ide has reloaded; anything it told us may be stale.
+                self._keep_results()
+                self._span_query_cache.clear()
+                self._exp_types_index.invalidate()
+                if self._compiled_modules is None:
+                    self._identifiers.invalidate()
+                elif self._compiled_modules:
+                    self._identifiers.modules_reloaded(self._compiled_modules)
+                self._compiled_modules = set()
+                self.get_loaded_modules()
+                for listener in self._update_listeners:
+                    listener()
+
+
+    def _keep_results(self):
+        """
+        Copy the indexes' results for files matching their contents on disk
+        into the store, before the indexes are dropped.
+        """
+        if self._store is None:
+            return
+        for (file_path, (changedtick, content_hash)) in list(self._clean_files.items()):
+            self._store.update(file_path, content_hash,
+                    self._exp_types_index.export(file_path, changedtick),
+                    self._identifiers.export(file_path, changedtick))
+
+
+    def _remember_updates(self, updates):
+        for update in updates:
+            tag = update.get("tag")
+            if tag == "RequestUpdateSourceFile":
+                file_path = update["contents"][0]
+                self._session_state.pop(file_path, None)
+                self._session_state[file_path] = update
+            elif tag == "RequestUpdateSourceFileFromFile":
+                # stack-ide reads the file itself once restarted.
+                self._session_state.pop(update["contents"], None)
+
+
+    def _resend_session_state(self):
+        # stack-ide has been restarted and knows nothing of our buffers.
+        self._keep_results()
+        self._span_query_cache.clear()
+        self._exp_types_index.invalidate()
+        self._identifiers.invalidate()
+        updates = list(self._session_state.values())
+        if updates:
+            self.update_session(updates)
+
+
+    def _encode_contents(self, contents):
         if contents is None:
             contents = []
         try:
@@ -23,4 +425,31 @@ class StackIdeApi(object):
             pass
         else:
             contents = contents.to_stack_ide_contents()
-        self._session.send_request(tag, contents, handler)
+        return contents
+
+
+def _is_position(source_span):
+    """
+    Whether source_span covers a single character, as cursor queries do.
+    """
+    return (source_span.from_line == source_span.to_line
+            and source_span.to_column == source_span.from_column + 1)
+
+
+def _is_update_progress(tag, contents):
+    return (tag == "ResponseUpdateSession" and isinstance(contents, dict)
+            and contents.get("tag") == "UpdateStatusProgress")
+
+
+def _chain_future(inner, outer):
+    """
+    Resolve the future outer with the outcome of inner.
+    """
+    def copy(inner):
+        if inner.cancelled():
+            outer.cancel()
+        elif inner.exception() is not None:
+            outer.set_exception(inner.exception())
+        else:
+            outer.set_result(inner.result())
+    inner.add_done_callback(copy)
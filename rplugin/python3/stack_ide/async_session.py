@@ -1,38 +1,243 @@
 import json
 import sys
+import time
 import traceback
 import uuid
 
+try:
+    from stack_ide.pending import PendingRequests
+    from stack_ide.scheduler import RequestScheduler
+    from stack_ide.stats import RequestStats
+except ImportError:
+    from pending import PendingRequests
+    from scheduler import RequestScheduler
+    from stats import RequestStats
+
+
+# Synthetic response tag delivered to the handlers of requests which will
+# never be answered because stack-ide died. Its contents are a message.
+SESSION_DIED = "ResponseSessionDied"
+
+# Synthetic response tag delivered to the handlers of requests which missed
+# their deadline (see PendingRequests). Its contents are a message.
+REQUEST_TIMEOUT = "ResponseTimeout"
+
 
 class AsyncSession(object):
     """
     Asynchronous session for a given stack ide process.
+
+    Each request's send, first response, partial responses and final
+    response are reported to stats, keyed by seq.
+
+    If the process exits, a supervisor (see supervisor.py) decides whether
+    to restart it; without one, or once it gives up, every pending request is
+    failed with a SESSION_DIED response.
+
+    Requests awaiting responses are kept in a bounded PendingRequests
+    registry. Those which time out get a REQUEST_TIMEOUT response, and new
+    requests are refused while the registry is full.
+
+    Given a Dispatcher, shared with the JsonStream, every handler runs on
+    its thread: responses, timeouts and failures alike.
+
+    Requests with a handler go through a RequestScheduler, which holds back
+    diagnostics and background requests so that cursor queries aren't
+    written behind them. They join the registry when they are sent.
     """
-    def __init__(self, json_stream, debug):
+    def __init__(self, json_stream, debug, stats=None, supervisor=None, pending_requests=None,
+            dispatcher=None, scheduler=None):
         self._json_stream = json_stream
         self._debug = debug
-        self._pending_requests = {}
+        self._dispatcher = dispatcher
+        if pending_requests is None:
+            pending_requests = PendingRequests(self._on_expired)
+        self._pending_requests = pending_requests
+        if scheduler is None:
+            scheduler = RequestScheduler(self._transmit)
+        self._scheduler = scheduler
+        self.stats = stats if stats is not None else RequestStats()
+        self._supervisor = supervisor
+        self._restart_listeners = []
+        self._ending = False
+        self._dead = False
+        self._restarted_at = None
 
 
     def run(self, default_handler):
         self._default_handler = default_handler
-        self._json_stream.run(self._on_message)
+        self._json_stream.run(self._on_message, self._on_exit)
+
 
+    def send_request(self, tag, contents, on_response=None):
+        """
+        Send a request, calling on_response with each response to it.
 
-    def send_request(self, tag, contents, on_response):
+        Requests with on_response are scheduled, and may be sent later; if
+        they then can't be, on_response gets a SESSION_DIED response.
+        Returns whether the request could be sent or scheduled.
+        """
         seq = str(uuid.uuid4())
-        self._pending_requests[seq] = on_response
         request = {"tag": tag, "contents": contents, "seq": seq}
-        return self._json_stream.send(request)
+        if on_response is None:
+            self.stats.request_sent(seq, tag, len(self._pending_requests))
+            if self._json_stream.send(request):
+                return True
+            self.stats.request_abandoned(seq)
+            return False
+        if not self._scheduler.submit(seq, tag, (request, on_response)):
+            self._debug.warning("+ Refusing {0}: {1} requests already queued".format(
+                tag, self._scheduler.queued_count()))
+            return False
+        return True
+
+
+    @property
+    def pid(self):
+        return self._json_stream.pid
+
+
+    def pending_count(self):
+        """
+        The number of requests in flight or waiting to be sent.
+        """
+        return len(self._pending_requests) + self._scheduler.queued_count()
+
+
+    def scheduler_stats(self):
+        return self._scheduler.stats()
+
+
+    def is_alive(self):
+        """
+        Whether the session is running or being restarted.
+        """
+        return not self._dead
+
+
+    def add_restart_listener(self, listener):
+        """
+        Call listener with no arguments each time the process is restarted,
+        before in-flight requests are replayed.
+        """
+        self._restart_listeners.append(listener)
 
 
     def end(self):
         """
         Ask stack-ide to shut down.
         """
+        self._ending = True
         self.send_request("RequestShutdownSession", [])
 
 
+    def restart(self):
+        """
+        Start the process again and run the restart listeners.
+
+        Returns False, without restarting, if the session has been ended.
+        """
+        if self._ending or self._dead:
+            return False
+        self._restarted_at = time.monotonic()
+        self._json_stream.restart()
+        for listener in self._restart_listeners:
+            self._run_listener(listener)
+        return True
+
+
+    def replay_pending(self, deadline):
+        """
+        Send each request pending since before the restart again, failing
+        those sent more than deadline seconds ago.
+        """
+        now = time.monotonic()
+        for (seq, entry) in self._pending_requests.items():
+            if self._restarted_at is not None and entry.sent_at >= self._restarted_at:
+                # Sent to the new process already.
+                continue
+            elif now - entry.sent_at > deadline:
+                self._fail(seq, "request not replayed after {0:.0f}s".format(now - entry.sent_at))
+            elif not self._json_stream.send(entry.request):
+                self._fail(seq, "couldn't replay request")
+            else:
+                self._pending_requests.refresh(seq)
+                self._debug("+ Replayed {0} {1}".format(entry.request["tag"], seq))
+
+
+    def fail_pending(self, reason, older_than=None):
+        """
+        Fail each pending request, or only those sent more than older_than
+        seconds ago, with a SESSION_DIED response.
+        """
+        now = time.monotonic()
+        for (seq, entry) in self._pending_requests.items():
+            if older_than is None or now - entry.sent_at > older_than:
+                self._fail(seq, reason)
+
+
+    def give_up(self, reason):
+        """
+        Mark the session dead and fail every pending request.
+        """
+        self._dead = True
+        for (seq, (request, handler)) in self._scheduler.drain():
+            self._deliver(handler, SESSION_DIED, reason)
+        self.fail_pending(reason)
+        self._pending_requests.close()
+
+
+    def _transmit(self, seq, item, waited):
+        # Called by the scheduler when the request's turn has come.
+        (request, on_response) = item
+        tag = request["tag"]
+        self.stats.timed("queued", waited)
+        if not self._pending_requests.add(seq, request, on_response):
+            self._debug.warning("+ Refusing {0}: {1} requests already in flight".format(
+                tag, len(self._pending_requests)))
+            self._scheduler.release(seq)
+            self._deliver(on_response, SESSION_DIED, "too many requests in flight")
+            return
+        self.stats.request_sent(seq, tag, len(self._pending_requests))
+        if not self._json_stream.send(request):
+            self._fail(seq, "couldn't send request")
+
+
+    def _fail(self, seq, reason):
+        entry = self._pending_requests.pop(seq)
+        if entry is None:
+            return
+        self._scheduler.release(seq)
+        self.stats.request_abandoned(seq)
+        self._deliver(entry.handler, SESSION_DIED, reason)
+
+
+    def _on_expired(self, seq, entry):
+        self._scheduler.release(seq)
+        tag = entry.request["tag"]
+        self._debug.warning("+ {0} {1} timed out".format(tag, seq))
+        self.stats.request_timed_out(seq)
+        self._deliver(entry.handler, REQUEST_TIMEOUT, "{0} timed out after {1:.0f}s".format(
+            tag, time.monotonic() - entry.sent_at))
+
+
+    def _deliver(self, handler, tag, contents):
+        """
+        Run handler for a synthetic response on the dispatcher, if any.
+        """
+        if self._dispatcher is None or self._dispatcher.is_dispatch_thread():
+            self._run_handler(handler, tag, contents)
+        else:
+            self._dispatcher.submit(self._run_handler, handler, tag, contents)
+
+
+    def _on_exit(self, returncode):
+        if self._ending or self._supervisor is None:
+            self.give_up("stack-ide exited with status {0}".format(returncode))
+        else:
+            self._supervisor.process_exited(self, returncode)
+
+
     def _on_message(self, msg):
         """
         Process each message from the JSON stream.
@@ -44,14 +249,20 @@ class AsyncSession(object):
         if seq is None:
             self._run_handler(self._default_handler, tag, contents)
         else:
-            handler = self._pending_requests.get(seq)
+            entry = self._pending_requests.get(seq)
 
-            if handler is not None:
-                resp = self._run_handler(handler, tag, contents)
+            if entry is not None:
+                started = time.perf_counter()
+                resp = self._run_handler(entry.handler, tag, contents)
+                self.stats.timed("handler", time.perf_counter() - started)
+                self.stats.response_received(seq, final=(resp != 'partial'))
                 if resp != 'partial':
                     # The handler has completed processing (or errored).
                     # Either way were done with this request.
-                    del self._pending_requests[seq]
+                    self._pending_requests.pop(seq)
+                    self._scheduler.release(seq)
+                else:
+                    self._pending_requests.refresh(seq)
 
 
     def _run_handler(self, handler, tag, contents):
@@ -59,5 +270,13 @@ class AsyncSession(object):
             return handler(tag, contents)
         except:
             exc = traceback.format_exception(*sys.exc_info())
-            self._debug("+ Response handler raised. {0}".format(exc))
+            self._debug.error("+ Response handler raised. {0}".format(exc))
             return 'error'
+
+
+    def _run_listener(self, listener):
+        try:
+            listener()
+        except:
+            exc = traceback.format_exception(*sys.exc_info())
+            self._debug.error("+ Restart listener raised. {0}".format(exc))
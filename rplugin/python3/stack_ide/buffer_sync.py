@@ -0,0 +1,139 @@
+import collections
+import os
+import threading
+
+
+class BufferSync(object):
+    """
+    Push unsaved buffer contents to stack-ide.
+
+    Changes are debounced: once no buffer has changed for `delay` seconds the
+    contents of every changed buffer are sent to its session in a single
+    RequestUpdateSession. A buffer is only resent when its changedtick differs
+    from the one last sent.
+
+    Like the Coalescer's queries, at most one sync per session is in flight:
+    stack-ide recompiles for each RequestUpdateSession, so updates made
+    while one is being compiled are parked, a file's later update replacing
+    its earlier one, and sent together once it has finished.
+    """
+    def __init__(self, vim, debug, api_for_buffer, update_handler, delay=0.3):
+        self._vim = vim
+        self._debug = debug
+        self._api_for_buffer = api_for_buffer
+        self._update_handler = update_handler
+        self.delay = delay
+
+        self._lock = threading.Lock()
+        self._timer = None
+        # Buffer number to the changedtick reported by TextChanged.
+        self._changed = {}
+        # Buffer number to (api, file path, changedtick) last sent.
+        self._synced = {}
+        # id(api) of each session with a sync in flight, to (api, updates
+        # by file path) parked until it has finished.
+        self._in_flight = {}
+
+
+    def buffer_changed(self, buffer_number, changedtick):
+        """
+        Note that a buffer has changed. May be called from any thread.
+        """
+        with self._lock:
+            self._changed[buffer_number] = changedtick
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+
+    def buffer_unloaded(self, buffer_number):
+        """
+        Point stack-ide back at the file on disk for a buffer whose unsaved
+        contents it may have been sent.
+        """
+        with self._lock:
+            self._changed.pop(buffer_number, None)
+            synced = self._synced.pop(buffer_number, None)
+        if synced is not None:
+            (api, file_path, _changedtick) = synced
+            update = {"tag": "RequestUpdateSourceFileFromFile", "contents": file_path}
+            self._send(api, [(file_path, update)])
+
+
+    def flush(self):
+        """
+        Send the contents of the changed buffers. Must run on Neovim's thread.
+        """
+        with self._lock:
+            changed = self._changed
+            self._changed = {}
+            self._timer = None
+
+        updates = {}
+        for (buffer_number, changedtick) in changed.items():
+            synced = self._synced.get(buffer_number)
+            if synced is not None and synced[2] == changedtick:
+                continue
+            buffer = self._buffer(buffer_number)
+            if buffer is None:
+                continue
+            project_root = buffer.vars.get('stack_ide_project_root')
+            if project_root is None:
+                # Not part of a stack project, e.g. `stack path` failed.
+                continue
+            try:
+                api = self._api_for_buffer(buffer)
+            except Exception as exc:
+                self._debug.warning("+ Not syncing {0}: {1}".format(buffer.name, exc))
+                continue
+            file_path = os.path.relpath(buffer.name, project_root)
+            contents = "\n".join(buffer[:]) + "\n"
+            update = {"tag": "RequestUpdateSourceFile", "contents": [file_path, contents]}
+            updates.setdefault(id(api), (api, []))[1].append((file_path, update))
+            self._synced[buffer_number] = (api, file_path, changedtick)
+
+        for (api, session_updates) in updates.values():
+            self._send(api, session_updates)
+
+
+    def _send(self, api, updates):
+        """
+        Send a list of (file path, update) to api, or park them if a sync
+        of the session is already in flight.
+        """
+        with self._lock:
+            parked = self._in_flight.get(id(api))
+            if parked is not None:
+                parked[1].update(updates)
+                return
+            self._in_flight[id(api)] = (api, collections.OrderedDict())
+        self._update_session(api, [update for (_file_path, update) in updates])
+
+
+    def _update_session(self, api, updates):
+        self._debug("+ Syncing {0} buffer(s) to stack-ide".format(len(updates)))
+        future = api.update_session(updates, self._update_handler)
+        future.add_done_callback(lambda _future: self._synced_session(api))
+
+
+    def _synced_session(self, api):
+        with self._lock:
+            (_api, parked) = self._in_flight[id(api)]
+            if not parked:
+                del self._in_flight[id(api)]
+                return
+            self._in_flight[id(api)] = (api, collections.OrderedDict())
+        self._update_session(api, list(parked.values()))
+
+
+    def _on_timer(self):
+        self._vim.session.threadsafe_call(self.flush)
+
+
+    def _buffer(self, buffer_number):
+        for buffer in self._vim.buffers:
+            if buffer.number == buffer_number:
+                return buffer
+        return None
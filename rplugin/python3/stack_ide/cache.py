@@ -0,0 +1,52 @@
+import collections
+import threading
+
+
+class LruCache(object):
+    """
+    Bounded least-recently-used cache with hit and miss counters.
+
+    Safe to use from both the Neovim RPC thread and the stack-ide reader
+    threads.
+    """
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                    "size": len(self._entries),
+                    "max_size": self._max_size,
+                    "hits": self.hits,
+                    "misses": self.misses
+                    }
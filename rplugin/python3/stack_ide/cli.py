@@ -1,35 +1,244 @@
-import sys
+"""
+Headless batch client for stack-ide.
+
+Boots one stack-ide session, keeps up to --concurrency queries in flight
+over it and streams each result to stdout as a line of JSON, in the order
+the answers arrive. Throughput and latency are reported on stderr.
+
+Queries come from the command line or from a JSONL stream:
+
+    cli.py [options] SPEC...
+    cli.py [options] --input queries.jsonl
+
+SPEC is FILE:LINE:COL, FILE:LINE:COL-LINE:COL, or just FILE to query the
+start of every identifier in the file. Each input line is an object with
+"file", "line" and "column", and optionally "end_line", "end_column" and
+"query" (exp-types or span-info). Files are relative to the project root.
+An input line which can't be read gives an error record with its
+"input_line" number, and the run carries on.
+"""
+import argparse
 import json
+import os
+import re
+import shlex
+import sys
+import threading
+import time
+
+from common import (DebugLog, Histogram, Process, SourceSpan, api_for_process,
+        boot_stack_ide_process, format_summary, to_json)
+
+
+QUERIES = {
+        "exp-types": "RequestGetExpTypes",
+        "span-info": "RequestGetSpanInfo"
+        }
+
+_SPEC_RE = re.compile(r"^(.*?):(\d+):(\d+)(?:-(\d+):(\d+))?$")
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][\w']*")
+
+
+def parse_spec(spec, project_root, queries):
+    """
+    Yield a query dict for each position a command line SPEC names.
+    """
+    match = _SPEC_RE.match(spec)
+    if match:
+        (file_path, line, column, end_line, end_column) = match.groups()
+        for query in queries:
+            yield make_query(query, file_path, int(line), int(column),
+                    int(end_line) if end_line else None, int(end_column) if end_column else None)
+        return
+    with open(os.path.join(project_root, spec), encoding="UTF-8", errors="replace") as f:
+        for (line_number, text) in enumerate(f, 1):
+            for match in _IDENTIFIER_RE.finditer(text):
+                for query in queries:
+                    yield make_query(query, spec, line_number, match.start() + 1)
+
+
+def parse_jsonl(stream, queries):
+    """
+    Yield a query dict for each line of a JSONL stream, or an error record
+    for a line which isn't a valid query.
+    """
+    for (line_number, line) in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            parsed = [make_query(query, item["file"], item["line"], item["column"],
+                    item.get("end_line"), item.get("end_column"))
+                for query in ([item["query"]] if "query" in item else queries)]
+        except KeyError as exc:
+            yield {"input_line": line_number, "error": "Missing {0}".format(exc)}
+        except (ValueError, TypeError) as exc:
+            yield {"input_line": line_number, "error": str(exc)}
+        else:
+            for query in parsed:
+                yield query
+
+
+def make_query(query, file_path, line, column, end_line=None, end_column=None):
+    if query not in QUERIES:
+        raise ValueError("Unknown query {0!r}; expected one of {1}".format(query, ", ".join(sorted(QUERIES))))
+    return {
+            "query": query,
+            "file": file_path,
+            "line": line,
+            "column": column,
+            "end_line": end_line if end_line is not None else line,
+            "end_column": end_column if end_column is not None else column + 1
+            }
 
-from common import *
 
-def logger(tag, content):
-    print("Handling tag", tag)
-    print("Content:", json.JSONEncoder().encode(content))
+class BatchRunner(object):
+    """
+    Pipeline queries over one session, writing results as JSONL.
+    """
+    def __init__(self, api, output, concurrency, timeout):
+        self._api = api
+        self._output = output
+        self._window = threading.BoundedSemaphore(concurrency)
+        self._timeout = timeout
+        self._output_lock = threading.Lock()
+        self._done = threading.Condition()
+        self._in_flight = 0
+        self.latencies = Histogram(size=100000)
+        self.count = 0
+        self.errors = 0
+
+
+    def run(self, queries):
+        for (query_id, query) in enumerate(queries):
+            if "error" in query:
+                self.write(dict(query, id=query_id))
+                with self._done:
+                    self.count += 1
+                    self.errors += 1
+                continue
+            self._window.acquire()
+            with self._done:
+                self._in_flight += 1
+            self._send(query_id, query)
+        with self._done:
+            while self._in_flight:
+                if not self._done.wait(self._timeout):
+                    break
+
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._output_lock:
+            self._output.write(line + "\n")
+            self._output.flush()
+
+
+    def _send(self, query_id, query):
+        source_span = SourceSpan(query["file"], query["line"], query["end_line"],
+                query["column"], query["end_column"])
+        started = time.perf_counter()
+        # Sent without the API's caching and coalescing: every query wants
+        # its own answer.
+        future = self._api.send_request(QUERIES[query["query"]], source_span)
+
+        def on_done(future):
+            record = dict(query, id=query_id)
+            try:
+                [tag, contents] = future.result()
+            except Exception as exc:
+                record["error"] = str(exc)
+            else:
+                if tag == "ResponseInvalidRequest":
+                    record["error"] = contents
+                else:
+                    record["result"] = to_json(contents)
+            self._finished(record, time.perf_counter() - started)
+        future.add_done_callback(on_done)
+
+
+    def _finished(self, record, seconds):
+        self.write(record)
+        with self._done:
+            self.count += 1
+            if "error" in record:
+                self.errors += 1
+            else:
+                self.latencies.add(seconds)
+            self._in_flight -= 1
+            self._done.notify()
+        self._window.release()
+
+
+def boot_process(args, debug):
+    if args.stack_ide_cmd:
+        return Process(name="stack ide", process_args=shlex.split(args.stack_ide_cmd),
+                cwd=args.project_root, debug=debug)
+    stack_yaml = args.stack_yaml or os.path.join(args.project_root, "stack.yaml")
+    return boot_stack_ide_process(args.project_root, args.target or '', stack_yaml, debug)
 
 
 def main(argv):
-    target = argv[1]
-    if target == None:
-        print("Usage: stack-ide.py TARGET")
-        sys.exit(255)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("specs", nargs="*", metavar="SPEC")
+    parser.add_argument("--input", help="JSONL file of queries, or - for stdin")
+    parser.add_argument("--project-root", default=os.getcwd())
+    parser.add_argument("--stack-yaml")
+    parser.add_argument("--target", action="append",
+            help="target to load; may be repeated (default: every package)")
+    parser.add_argument("--stack-ide-cmd",
+            help="command speaking stack-ide's protocol to use instead of `stack ide start`")
+    parser.add_argument("--queries", default="exp-types",
+            help="comma separated queries for each SPEC: exp-types, span-info")
+    parser.add_argument("--source-errors", action="store_true",
+            help="also write the source errors once the session has loaded")
+    parser.add_argument("--concurrency", type=int, default=64,
+            help="queries kept in flight (the session allows 256)")
+    parser.add_argument("--timeout", type=float, default=600,
+            help="seconds to wait for the session to load and for the last answers")
+    parser.add_argument("--log-level", help="log to --log-file at this level, e.g. debug")
+    parser.add_argument("--log-file")
+    args = parser.parse_args(argv[1:])
+    if not args.specs and not args.input:
+        parser.error("give SPECs or --input")
+    args.project_root = os.path.abspath(args.project_root)
+    queries = args.queries.split(",")
+    unknown = [query for query in queries if query not in QUERIES]
+    if unknown:
+        parser.error("unknown --queries {0}; expected {1}".format(
+            ", ".join(unknown), ", ".join(sorted(QUERIES))))
+
+    debug = DebugLog()
+    debug.configure(level=args.log_level, path=args.log_file)
+    api = api_for_process(boot_process(args, debug), lambda tag, contents: None, debug)
+
+    runner = BatchRunner(api, sys.stdout, args.concurrency, args.timeout)
+    started = time.perf_counter()
     try:
-        manager = None
-        def mk_signal_handler(manager):
-            def signal_handler(signal, frame):
-                manager.end()
-            return signal_handler
-        import signal
-
-        manager = StackIdeManager(target, logger, print)
-        signal.signal(signal.SIGINT, mk_signal_handler(manager))
-        api = StackIdeApi(manager)
-        api.get_source_errors()
-        api.get_loaded_modules()
-    except:
-        if manager:
-            manager.end()
+        api.warm_up().result(args.timeout)
+        loaded = time.perf_counter()
+        if args.source_errors:
+            for diagnostic in api.send_request_sync("RequestGetSourceErrors", timeout=args.timeout)[1]:
+                runner.write(dict(diagnostic._asdict(), query="source-errors"))
+
+        if args.input:
+            stream = sys.stdin if args.input == "-" else open(args.input, encoding="UTF-8")
+            work = parse_jsonl(stream, queries)
+        else:
+            work = (query for spec in args.specs
+                    for query in parse_spec(spec, args.project_root, queries))
+        runner.run(work)
+        finished = time.perf_counter()
+    finally:
+        api.end()
+        debug.close()
+
+    elapsed = finished - loaded
+    sys.stderr.write("loaded in {0:.2f}s; {1} queries in {2:.2f}s, {3:.0f}/s, {4} errors; latency {5}\n".format(
+        loaded - started, runner.count, elapsed, runner.count / elapsed if elapsed else 0,
+        runner.errors, format_summary(runner.latencies.summary())))
+    return 1 if runner.errors else 0
 
 
 if __name__ == '__main__':
-    main(sys.argv)
+    sys.exit(main(sys.argv))
@@ -0,0 +1,111 @@
+import concurrent.futures
+import threading
+
+
+class Coalescer(object):
+    """
+    Latest-wins coalescing of cursor driven queries.
+
+    At most one query per key is in flight. A query made while another with
+    the same key is in flight is parked, replacing (and cancelling) any query
+    already parked. When the in-flight query answers, its response is dropped
+    if a newer query has been made since, and the parked query is sent.
+    """
+    def __init__(self, send_request):
+        # send_request(tag, contents, handler) -> Future
+        self._send_request = send_request
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._in_flight = set()
+        self._parked = {}
+        self.dropped = 0
+        self.cancelled = 0
+
+
+    def send_request(self, key, tag, contents, handler, observer=None):
+        """
+        Send a query superseding any earlier query with the same key.
+
+        observer is called with every response, including those which are
+        dropped before reaching handler. Returns a future which is cancelled
+        if the query is superseded.
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            generation = self._supersede(key)
+            if key in self._in_flight:
+                self._parked[key] = (generation, tag, contents, handler, observer, future)
+                return future
+            self._in_flight.add(key)
+        self._dispatch(key, generation, tag, contents, handler, observer, future)
+        return future
+
+
+    def supersede(self, key):
+        """
+        Mark any query with this key as stale, e.g. because it was answered
+        locally.
+        """
+        with self._lock:
+            self._supersede(key)
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                    "in_flight": len(self._in_flight),
+                    "dropped": self.dropped,
+                    "cancelled": self.cancelled
+                    }
+
+
+    def _supersede(self, key):
+        # Must be called with the lock held.
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+        parked = self._parked.pop(key, None)
+        if parked is not None:
+            parked[-1].cancel()
+            self.cancelled += 1
+        return generation
+
+
+    def _is_current(self, key, generation):
+        with self._lock:
+            return self._generations.get(key) == generation
+
+
+    def _dispatch(self, key, generation, tag, contents, handler, observer, future):
+        def on_response(resp_tag, resp_contents):
+            if observer is not None:
+                observer(resp_tag, resp_contents)
+            if not self._is_current(key, generation):
+                with self._lock:
+                    self.dropped += 1
+                return 'done'
+            return handler(resp_tag, resp_contents)
+
+        def on_done(inner):
+            self._on_done(key, generation, inner, future)
+
+        inner = self._send_request(tag, contents, on_response)
+        inner.add_done_callback(on_done)
+
+
+    def _on_done(self, key, generation, inner, future):
+        if self._is_current(key, generation):
+            exc = inner.exception()
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(inner.result())
+        else:
+            future.cancel()
+
+        with self._lock:
+            parked = self._parked.pop(key, None)
+            if parked is None:
+                self._in_flight.discard(key)
+                return
+        (generation, tag, contents, handler, observer, future) = parked
+        self._dispatch(key, generation, tag, contents, handler, observer, future)
@@ -0,0 +1,53 @@
+import collections
+import json
+
+
+JsonCodec = collections.namedtuple('JsonCodec', 'name loads dumps')
+JsonCodec.__doc__ = """
+A JSON implementation: loads parses bytes and dumps returns UTF-8 bytes.
+"""
+
+
+def _stdlib_codec():
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    return JsonCodec(
+            'json',
+            json.loads,
+            lambda obj: encoder.encode(obj).encode('UTF-8'))
+
+
+def _orjson_codec():
+    import orjson
+    return JsonCodec('orjson', orjson.loads, orjson.dumps)
+
+
+def _ujson_codec():
+    import ujson
+    return JsonCodec(
+            'ujson',
+            ujson.loads,
+            lambda obj: ujson.dumps(obj, ensure_ascii=False).encode('UTF-8'))
+
+
+# Fastest first.
+_CODECS = collections.OrderedDict([
+        ('orjson', _orjson_codec),
+        ('ujson', _ujson_codec),
+        ('json', _stdlib_codec)
+        ])
+
+
+def json_codec(name=None):
+    """
+    Return the named JsonCodec, or the fastest one installed.
+
+    Falls back to the standard library json module if the named codec is
+    not installed.
+    """
+    names = [name] if name in _CODECS else list(_CODECS)
+    for n in names:
+        try:
+            return _CODECS[n]()
+        except ImportError:
+            pass
+    return _stdlib_codec()
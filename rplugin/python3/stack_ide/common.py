@@ -4,40 +4,78 @@ import subprocess
 try:
     from stack_ide.api import *
     from stack_ide.async_session import *
+    from stack_ide.buffer_sync import *
+    from stack_ide.debug_log import *
+    from stack_ide.diagnostics import *
+    from stack_ide.dispatch import *
+    from stack_ide.identifiers import *
     from stack_ide.json_stream import *
+    from stack_ide.path_cache import *
+    from stack_ide.pending import *
+    from stack_ide.pool import *
     from stack_ide.process import *
+    from stack_ide.project import *
+    from stack_ide.records import *
+    from stack_ide.result_store import *
+    from stack_ide.scheduler import *
     from stack_ide.session import *
-except:
+    from stack_ide.stats import *
+    from stack_ide.supervisor import *
+except ImportError:
     from api import *
     from async_session import *
+    from buffer_sync import *
+    from debug_log import *
+    from diagnostics import *
+    from dispatch import *
+    from identifiers import *
     from json_stream import *
+    from path_cache import *
+    from pending import *
+    from pool import *
     from process import *
+    from project import *
+    from records import *
+    from result_store import *
+    from scheduler import *
     from session import *
+    from stats import *
+    from supervisor import *
 
 
-def stack_ide_api_for(project_root, target, stack_yaml, default_handler, debug):
-    stack_ide_process = boot_stack_ide_process(project_root, target, stack_yaml, debug)
-    json_stream = JsonStream(stack_ide_process, debug)
-    async_session = AsyncSession(json_stream, debug)
+def stack_ide_api_for(project_root, targets, stack_yaml, default_handler, debug, dispatcher=None):
+    stack_ide_process = boot_stack_ide_process(project_root, targets, stack_yaml, debug)
+    return api_for_process(stack_ide_process, default_handler, debug, dispatcher=dispatcher)
+
+
+def api_for_process(process, default_handler, debug, supervisor=None, dispatcher=None):
+    """
+    Build the stack-ide API on top of a Process and start it.
+
+    Anything speaking stack-ide's protocol on stdin/stdout will do, such as
+    the fake server used by the benchmarks. The process is restarted by
+    supervisor, or by a default Supervisor, if it dies. Responses are
+    handled on dispatcher's thread, or on a Dispatcher of the session's own.
+    """
+    if supervisor is None:
+        supervisor = Supervisor(debug)
+    if dispatcher is None:
+        dispatcher = Dispatcher(debug)
+    stats = RequestStats()
+    json_stream = JsonStream(process, debug, stats=stats, dispatcher=dispatcher)
+    async_session = AsyncSession(json_stream, debug, stats, supervisor, dispatcher=dispatcher)
     session = Session(async_session, debug)
     api = StackIdeApi(session)
-    async_session.run(default_handler)
+    async_session.run(api.wrap_handler(default_handler))
     return api
 
 
-# XXX Improve this to load the list of targets from the stack
-# configuration file. If there is only one, there is no need to ask the
-# user. If there is more than one, we could ask the user to select from a
-# list.
 def guess_stack_target(filename, project_root, stack_yaml):
-    target = None
-    for d in walkup(os.path.dirname(os.path.realpath(filename))):
-        cabal_files = [ f for f in os.listdir(d) if f.endswith('.cabal') ]
-        if len(cabal_files) > 0:
-            cabal_file = cabal_files[0] if len(cabal_files) > 0 else None
-            target = cabal_file.rstrip('.cabal')
-            break
-    return target
+    """
+    Return the stack target whose source directories contain filename, or
+    None if it isn't part of any of the project's packages.
+    """
+    return project_index(project_root, stack_yaml).target_for(filename)
 
 
 def get_stack_path(path_type, cwd):
@@ -59,22 +97,3 @@ def walkup(path):
             at_top = True 
         else: 
             path = parent_path 
-
-
-class SourceSpan(object):
-    def __init__(self, file_path, from_line, to_line, from_column, to_column):
-        self.file_path = file_path
-        self.from_line = from_line
-        self.to_line = to_line
-        self.from_column = from_column
-        self.to_column = to_column
-
-
-    def to_stack_ide_contents(self):
-        return {
-                "spanFilePath": self.file_path,
-                "spanFromLine": self.from_line,
-                "spanToLine": self.to_line,
-                "spanFromColumn": self.from_column,
-                "spanToColumn": self.to_column
-                }
@@ -0,0 +1,123 @@
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+
+
+# Below DEBUG: full request and response payloads.
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
+
+LEVELS = {
+        "trace": TRACE,
+        "debug": logging.DEBUG,
+        "info": logging.INFO,
+        "warning": logging.WARNING,
+        "error": logging.ERROR
+        }
+
+_instances = itertools.count()
+
+
+def default_log_path():
+    """
+    Return a log path unique to this Neovim instance's plugin host.
+    """
+    return os.path.join(tempfile.gettempdir(), "stack_ide_debug.{0}.log".format(os.getpid()))
+
+
+class DebugLog(object):
+    """
+    Leveled debug log written by a background thread.
+
+    The instance is called like the old debug handler, debug(msg), to log at
+    DEBUG; info(), warning() and error() log at those levels, and payload()
+    logs request and response bodies at TRACE, truncated to max_payload
+    bytes. Records are queued and written by a QueueListener thread to a
+    size-rotated file, so callers never wait on disk.
+
+    Logging is off until configure() is given a level. While off no file is
+    opened, no thread runs and each call is a single level check.
+    """
+    def __init__(self):
+        self._logger = logging.getLogger("stack_ide.{0}".format(next(_instances)))
+        self._logger.propagate = False
+        self._logger.setLevel(logging.CRITICAL + 1)
+        self._listener = None
+        self.max_payload = 0
+        self.path = None
+
+
+    def configure(self, level=None, path=None, max_bytes=5 * 2**20, backup_count=3,
+            max_payload=2000):
+        """
+        Start logging at level to path, or stop logging if level is None or 0.
+
+        level is a name from LEVELS, 1 for debug, 2 for trace or a logging
+        level number.
+        """
+        self.close()
+        if isinstance(level, str):
+            level = LEVELS.get(level.lower())
+        elif level in (1, 2):
+            level = {1: logging.DEBUG, 2: TRACE}[level]
+        if not level:
+            return
+        self.path = path or default_log_path()
+        self.max_payload = max_payload
+
+        file_handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        file_handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)-5s [%(threadName)s] %(message)s"))
+        records = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(records, file_handler)
+        self._listener.start()
+        self._logger.addHandler(logging.handlers.QueueHandler(records))
+        self._logger.setLevel(level)
+
+
+    def close(self):
+        """
+        Stop logging, writing out any queued records.
+        """
+        for handler in list(self._logger.handlers):
+            self._logger.removeHandler(handler)
+        self._logger.setLevel(logging.CRITICAL + 1)
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+
+
+    def __call__(self, msg):
+        self._logger.debug(msg.rstrip("\n"))
+
+
+    def info(self, msg):
+        self._logger.info(msg)
+
+
+    def warning(self, msg):
+        self._logger.warning(msg)
+
+
+    def error(self, msg):
+        self._logger.error(msg)
+
+
+    def payload(self, direction, data):
+        """
+        Log a request or response body (bytes) at TRACE, truncated.
+        """
+        if not self._logger.isEnabledFor(TRACE):
+            return
+        if len(data) > self.max_payload:
+            text = "{0}... ({1} bytes)".format(
+                    data[:self.max_payload].decode('UTF-8', 'replace'), len(data))
+        else:
+            text = data.decode('UTF-8', 'replace')
+        self._logger.log(TRACE, "%s %s", direction, text.rstrip("\n"))
@@ -0,0 +1,95 @@
+import collections
+import itertools
+import sys
+
+
+Diagnostic = collections.namedtuple(
+        'Diagnostic', 'kind file_path from_line from_column to_line to_column message')
+
+
+def parse_source_errors(errors):
+    """
+    Turn the contents of a ResponseGetSourceErrors into Diagnostics.
+
+    Errors without a proper span (a TextSpan) have no file_path or lines.
+    """
+    diagnostics = []
+    for error in errors or []:
+        span = error.get("errorSpan") or {}
+        if span.get("tag") == "ProperSpan":
+            s = span["contents"]
+            diagnostic = Diagnostic(
+                    _intern(error.get("errorKind")), sys.intern(s["spanFilePath"]),
+                    s["spanFromLine"], s["spanFromColumn"],
+                    s["spanToLine"], s["spanToColumn"],
+                    error.get("errorMsg", ""))
+        else:
+            diagnostic = Diagnostic(
+                    _intern(error.get("errorKind")), None, None, None, None, None,
+                    error.get("errorMsg", ""))
+        diagnostics.append(diagnostic)
+    return diagnostics
+
+
+def _intern(string):
+    return sys.intern(string) if string is not None else None
+
+
+class DiagnosticSet(object):
+    """
+    The diagnostics of one project, and the signs placed for them.
+
+    update() diffs a new set of diagnostics against the signs already placed,
+    so only signs for diagnostics which appeared or disappeared are touched.
+    Signs are only placed in loaded buffers; diagnostics for other files get
+    their signs from place_in() once the file has been opened.
+    """
+    def __init__(self):
+        self.diagnostics = []
+        # Diagnostic to (sign id, file name) of its placed sign.
+        self.placed = {}
+        self._sign_ids = itertools.count(1)
+
+
+    def update(self, diagnostics, file_name, loaded_files):
+        """
+        Record a new set of diagnostics.
+
+        file_name maps a diagnostic's file_path to a buffer name. Returns
+        (added, removed): lists of (sign id, file name, diagnostic) to place
+        and (sign id, file name) to unplace.
+        """
+        self.diagnostics = diagnostics
+        wanted = set(d for d in diagnostics
+                if d.file_path is not None and file_name(d.file_path) in loaded_files)
+
+        removed = []
+        for diagnostic in [d for d in self.placed if d not in wanted]:
+            removed.append(self.placed.pop(diagnostic))
+
+        added = []
+        for diagnostic in wanted:
+            if diagnostic not in self.placed:
+                sign = (next(self._sign_ids), file_name(diagnostic.file_path))
+                self.placed[diagnostic] = sign
+                added.append(sign + (diagnostic,))
+        return added, removed
+
+
+    def place_in(self, name, file_name):
+        """
+        Return (sign id, file name, diagnostic) for each diagnostic in the
+        file called name, whose buffer has just been loaded. Diagnostics
+        which already have a sign keep its id, so placing it again moves it
+        rather than adding another.
+        """
+        signs = []
+        for diagnostic in self.diagnostics:
+            if diagnostic.file_path is None or file_name(diagnostic.file_path) != name:
+                continue
+            sign = self.placed.get(diagnostic)
+            if sign is None:
+                sign = (next(self._sign_ids), name)
+                self.placed[diagnostic] = sign
+            signs.append(sign + (diagnostic,))
+        return signs
@@ -0,0 +1,60 @@
+import queue
+import sys
+import threading
+import traceback
+
+
+class Dispatcher(object):
+    """
+    Runs callbacks one at a time, in submission order, on a single thread.
+
+    This is the plugin's concurrency model for responses. Process reader
+    threads only split stack-ide's output into lines and submit them here.
+    Decoding, the pending request table lookup and every response handler
+    then run on the dispatcher thread, as do timeouts and failures of
+    pending requests. Handlers which touch Neovim or their own state hand
+    that over to Neovim's loop with threadsafe_call.
+
+    The thread is started on first use and exits after idle_timeout seconds
+    without work, so a dispatcher whose sessions have ended costs nothing.
+    """
+    def __init__(self, debug, name="stack-ide dispatcher", idle_timeout=30.0):
+        self._debug = debug
+        self._name = name
+        self.idle_timeout = idle_timeout
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+
+    def submit(self, fn, *args):
+        """
+        Queue fn(*args) to run on the dispatcher thread.
+        """
+        with self._lock:
+            self._queue.put((fn, args))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name)
+                self._thread.daemon = True
+                self._thread.start()
+
+
+    def is_dispatch_thread(self):
+        return threading.current_thread() is self._thread
+
+
+    def _run(self):
+        while True:
+            try:
+                (fn, args) = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            try:
+                fn(*args)
+            except Exception:
+                exc = traceback.format_exception(*sys.exc_info())
+                self._debug.error("+ Dispatched callback raised. {0}".format(exc))
@@ -0,0 +1,44 @@
+class LineFramer(object):
+    """
+    Split a byte stream into newline terminated lines.
+
+    Chunks are searched in place and a line is only copied out once. A line
+    spanning several chunks is kept as a list of pieces and joined once it is
+    complete, so multi-megabyte responses are not copied again for every
+    chunk read.
+    """
+    def __init__(self):
+        self._pieces = []
+
+
+    def feed(self, chunk):
+        """
+        Return the lines (without their newlines) completed by chunk.
+        """
+        lines = []
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end == -1:
+                break
+            if self._pieces:
+                self._pieces.append(chunk[start:end])
+                lines.append(b"".join(self._pieces))
+                self._pieces = []
+            else:
+                lines.append(chunk[start:end])
+            start = end + 1
+        if start < len(chunk):
+            self._pieces.append(chunk[start:] if start else chunk)
+        return lines
+
+
+    def flush(self):
+        """
+        Return any incomplete final line, e.g. once the stream has ended.
+        """
+        if not self._pieces:
+            return []
+        line = b"".join(self._pieces)
+        self._pieces = []
+        return [line]
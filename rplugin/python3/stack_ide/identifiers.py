@@ -0,0 +1,216 @@
+import bisect
+import re
+import threading
+
+
+_COMPILING_RE = re.compile(r"Compiling\s+([A-Z][\w.']*)")
+
+
+def compiled_module(progress):
+    """
+    Return the module named by an UpdateStatusProgress, or None.
+    """
+    match = _COMPILING_RE.search(progress.get("progressParsedMsg") or "")
+    return match.group(1) if match else None
+
+
+class IdentifierIndex(object):
+    """
+    Index of the identifiers stack-ide has described in span info responses.
+
+    Occurrences are kept per file, tied to the buffer changedtick they were
+    returned for, so that span info for any position inside a known
+    occurrence is answered locally. Definitions are kept by module and name
+    for go-to-definition and lookups by name.
+
+    When stack-ide recompiles modules, only what depends on them is dropped:
+    their definitions, occurrences of their identifiers and occurrences in
+    their source files. Definitions in modules which are no longer loaded
+    are dropped when the loaded modules are set.
+    """
+    def __init__(self):
+        self._files = {}
+        # (module, name) to IdInfo
+        self._definitions = {}
+        # module to the source file it was defined in, where known
+        self._module_files = {}
+        self.loaded_modules = frozenset()
+        self._lock = threading.Lock()
+
+
+    def add_span_info(self, file_path, changedtick, infos):
+        """
+        Add the SpanInfos of a span info response.
+        """
+        entries = [info for info in infos if info.id_info is not None]
+        if not entries:
+            return
+        with self._lock:
+            index = self._files.get(file_path)
+            if index is None or index.changedtick != changedtick:
+                index = _FileOccurrences(changedtick)
+                self._files[file_path] = index
+            for info in entries:
+                id_info = info.id_info
+                index.add(info)
+                self._definitions[(id_info.module, id_info.name)] = id_info
+                if id_info.definition is not None:
+                    self._module_files[id_info.module] = id_info.definition.file_path
+
+
+    def export(self, file_path, changedtick):
+        """
+        Return the SpanInfos known for file_path at changedtick, which
+        add_span_info() takes back.
+        """
+        with self._lock:
+            index = self._files.get(file_path)
+            if index is None or index.changedtick != changedtick:
+                return []
+            return index.export()
+
+
+    def lookup(self, file_path, line, column, changedtick):
+        """
+        Return the SpanInfos of the identifier at a position, or None if it
+        isn't known.
+        """
+        with self._lock:
+            index = self._occurrences(file_path, changedtick)
+            return index.lookup((line, column)) if index is not None else None
+
+
+    def definition_at(self, file_path, line, column, changedtick):
+        """
+        Return the IdInfo of the identifier at a position, or None.
+        """
+        with self._lock:
+            index = self._occurrences(file_path, changedtick)
+            return index.id_info_at((line, column)) if index is not None else None
+
+
+    def find(self, name, module=None):
+        """
+        Return the IdInfo of each known identifier called name.
+        """
+        with self._lock:
+            return [id_info for ((m, n), id_info) in sorted(self._definitions.items())
+                    if n == name and (module is None or m == module)]
+
+
+    def set_loaded_modules(self, modules):
+        """
+        Record the modules stack-ide has loaded, dropping definitions in
+        modules of our packages which are no longer among them.
+        """
+        loaded = frozenset(modules)
+        with self._lock:
+            self.loaded_modules = loaded
+            gone = set(module for module in self._module_files if module not in loaded)
+            if gone:
+                self._drop_modules(gone)
+
+
+    def modules_reloaded(self, modules):
+        """
+        Drop everything which may have changed by recompiling modules.
+        """
+        with self._lock:
+            self._drop_modules(set(modules))
+
+
+    def invalidate(self):
+        """
+        Drop everything.
+        """
+        with self._lock:
+            self._files.clear()
+            self._definitions.clear()
+            self._module_files.clear()
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                    "files": len(self._files),
+                    "definitions": len(self._definitions),
+                    "loaded_modules": len(self.loaded_modules)
+                    }
+
+
+    def _occurrences(self, file_path, changedtick):
+        # Must be called with the lock held.
+        index = self._files.get(file_path)
+        if index is not None and index.changedtick != changedtick:
+            del self._files[file_path]
+            return None
+        return index
+
+
+    def _drop_modules(self, modules):
+        # Must be called with the lock held.
+        files = set(self._module_files.pop(module) for module in modules
+                if module in self._module_files)
+        for key in [key for key in self._definitions if key[0] in modules]:
+            del self._definitions[key]
+        for file_path in list(self._files):
+            if file_path in files or not self._files[file_path].drop_modules(modules):
+                del self._files[file_path]
+
+
+class _FileOccurrences(object):
+    """
+    The identifier occurrences of one file, sorted by start position.
+    """
+    def __init__(self, changedtick):
+        self.changedtick = changedtick
+        self._starts = []
+        # [start, end, SpanInfo]
+        self._entries = []
+
+
+    def add(self, info):
+        start = info.span.start
+        end = info.span.end
+        i = bisect.bisect_left(self._starts, start)
+        while i < len(self._starts) and self._starts[i] == start:
+            if self._entries[i][1] == end:
+                self._entries[i] = [start, end, info]
+                return
+            i += 1
+        self._starts.insert(i, start)
+        self._entries.insert(i, [start, end, info])
+
+
+    def export(self):
+        return [entry[2] for entry in self._entries]
+
+
+    def lookup(self, position):
+        entry = self._innermost(position)
+        return [entry[2]] if entry is not None else None
+
+
+    def id_info_at(self, position):
+        entry = self._innermost(position)
+        return entry[2].id_info if entry is not None else None
+
+
+    def drop_modules(self, modules):
+        """
+        Drop occurrences of identifiers from modules, returning how many are
+        left.
+        """
+        keep = [i for (i, entry) in enumerate(self._entries) if entry[2].id_info.module not in modules]
+        self._starts = [self._starts[i] for i in keep]
+        self._entries = [self._entries[i] for i in keep]
+        return len(self._entries)
+
+
+    def _innermost(self, position):
+        # Spans end at an exclusive column.
+        enclosing = [entry for entry in self._entries[:bisect.bisect_right(self._starts, position)]
+                if position < entry[1]]
+        if not enclosing:
+            return None
+        return max(enclosing, key=lambda entry: entry[0])
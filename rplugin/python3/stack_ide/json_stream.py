@@ -1,4 +1,11 @@
-import json
+import time
+
+try:
+    from stack_ide.codec import json_codec
+    from stack_ide.records import parse_contents
+except ImportError:
+    from codec import json_codec
+    from records import parse_contents
 
 
 class JsonStream(object):
@@ -7,24 +14,57 @@ class JsonStream(object):
 
     This wraps an interface for reading/writing bytes and exposes an interface
     for reading/writing JSON messages.
+
+    Given a Dispatcher, lines are decoded and on_message and on_exit called
+    on its thread rather than on the process's reader thread.
+
+    Response contents are parsed into the compact records of records.py
+    here, once, so everything past this point works on those.
     """
 
-    def __init__(self, stack_ide_process, debug):
+    def __init__(self, stack_ide_process, debug, codec=None, stats=None, dispatcher=None):
         self._process = stack_ide_process
         self._debug = debug
+        self._codec = codec if codec is not None else json_codec()
+        # Optional RequestStats to report bytes and codec times to.
+        self._stats = stats
+        self._dispatcher = dispatcher
 
 
-    def run(self, on_message):
+    def run(self, on_message, on_exit=None):
         self._on_message = on_message
-        self._process.run(self._on_stdout_line, self._on_stderr_line)
+        if self._dispatcher is None:
+            self._process.run(self._on_stdout_line, self._on_stderr_line, on_exit)
+            return
+
+        dispatcher = self._dispatcher
+        def dispatch_line(line):
+            dispatcher.submit(self._on_stdout_line, line)
+        def dispatch_exit(returncode):
+            # Queued behind the process's last lines.
+            dispatcher.submit(on_exit, returncode)
+        self._process.run(dispatch_line, self._on_stderr_line,
+                dispatch_exit if on_exit is not None else None)
+
+
+    def restart(self):
+        self._process.restart()
+
+
+    @property
+    def pid(self):
+        return self._process.pid
 
 
     def send(self, request):
-        if self._process.is_running:
-            encodedString = json.JSONEncoder().encode(request) + "\n"
-            return self._process.send(encodedString)
+        if self._process.is_running():
+            started = time.perf_counter()
+            encoded = self._codec.dumps(request) + b"\n"
+            if self._stats is not None:
+                self._stats.encoded(len(encoded), time.perf_counter() - started)
+            return self._process.send(encoded)
         else:
-            self._debug("+ Couldn't send request, no process!")
+            self._debug.warning("+ Couldn't send request, no process!")
             return False
 
 
@@ -34,11 +74,19 @@ class JsonStream(object):
 
     def _on_stdout_line(self, line):
         """
-        Process each line from the byte stream.
+        Process each line, as bytes, from the byte stream.
         """
+        started = time.perf_counter()
         try:
-            msg = json.loads(line)
-        except:
-            self._debug("+ reponse not valid JSON. Ignoring")
-        else:
-            self._on_message(msg)
+            msg = self._codec.loads(line)
+        except ValueError:
+            self._debug.warning("+ reponse not valid JSON. Ignoring")
+            return
+        try:
+            msg["contents"] = parse_contents(msg.get("tag"), msg.get("contents"))
+        except (KeyError, TypeError, AttributeError, ValueError) as exc:
+            self._debug.warning("+ Unexpected {0} contents: {1!r}".format(msg.get("tag"), exc))
+            msg["contents"] = []
+        if self._stats is not None:
+            self._stats.decoded(len(line), time.perf_counter() - started)
+        self._on_message(msg)
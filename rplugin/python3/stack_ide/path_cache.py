@@ -0,0 +1,145 @@
+import glob
+import json
+import os
+import threading
+
+
+def default_cache_dir():
+    """
+    Return the directory for the plugin's persistent caches.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "stack-ide-nvim")
+
+
+class StackPathCache(object):
+    """
+    Cache of `stack path` lookups, keyed by directory.
+
+    Each `stack path` call spawns a stack process, which is far too slow to do
+    for every buffer opened. Results are kept in memory and on disk, and are
+    reused for as long as the stack.yaml and .cabal files between the
+    directory and its project root are unchanged. A directory inside a
+    project already looked up reuses that project's result, unless there is
+    another stack.yaml on the way up to its root, so only the first file
+    opened in a project runs `stack path`.
+    """
+    def __init__(self, lookup, debug, cache_file=None):
+        # lookup(path_type, cwd) -> str, i.e. get_stack_path.
+        self._lookup = lookup
+        self._debug = debug
+        if cache_file is None:
+            cache_file = os.path.join(default_cache_dir(), "stack-paths.json")
+        self._cache_file = cache_file
+        self._entries = None
+        self._lock = threading.Lock()
+
+
+    def lookup(self, directory):
+        """
+        Return (project_root, stack_yaml) for directory.
+        """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(directory)
+            if entry is not None and self._is_fresh(entry):
+                return entry["project_root"], entry["stack_yaml"]
+            known = self._known_project(directory)
+
+        if known is not None:
+            (project_root, stack_yaml) = known
+        else:
+            project_root = self._lookup("project-root", directory)
+            stack_yaml = self._lookup("config-location", directory)
+        entry = {
+                "project_root": project_root,
+                "stack_yaml": stack_yaml,
+                "mtimes": self._watched_mtimes(directory, project_root, stack_yaml)
+                }
+        with self._lock:
+            self._entries[directory] = entry
+            self._save()
+        return project_root, stack_yaml
+
+
+    def invalidate(self, directory=None):
+        """
+        Forget the lookup for directory, or every lookup if it is None.
+        """
+        with self._lock:
+            self._load()
+            if directory is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(directory, None)
+            self._save()
+
+
+    def _known_project(self, directory):
+        """
+        Return (project_root, stack_yaml) of the innermost project already
+        looked up which contains directory, or None. Must be called with
+        the lock held.
+        """
+        entries = sorted((e for e in self._entries.values()
+                if _is_within(directory, e["project_root"]) and self._is_fresh(e)),
+                key=lambda e: len(e["project_root"]))
+        if not entries:
+            return None
+        entry = entries[-1]
+        # stack uses the nearest stack.yaml, which may be that of a nested
+        # project not looked up yet.
+        path = directory
+        while path != entry["project_root"]:
+            if os.path.isfile(os.path.join(path, "stack.yaml")):
+                return None
+            path = os.path.dirname(path)
+        return entry["project_root"], entry["stack_yaml"]
+
+
+    def _watched_mtimes(self, directory, project_root, stack_yaml):
+        paths = [stack_yaml]
+        path = directory
+        while True:
+            paths.extend(glob.glob(os.path.join(glob.escape(path), "*.cabal")))
+            parent = os.path.dirname(path)
+            if path == project_root or parent == path:
+                break
+            path = parent
+        return dict((p, _mtime(p)) for p in paths)
+
+
+    def _is_fresh(self, entry):
+        return all(_mtime(path) == mtime for path, mtime in entry["mtimes"].items())
+
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        try:
+            with open(self._cache_file) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+
+    def _save(self):
+        tmp_file = "{0}.{1}.tmp".format(self._cache_file, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self._cache_file), exist_ok=True)
+            with open(tmp_file, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_file, self._cache_file)
+        except OSError as exc:
+            self._debug.warning("+ Couldn't write {0}: {1}".format(self._cache_file, exc))
+
+
+def _is_within(path, directory):
+    return path == directory or path.startswith(os.path.join(directory, ""))
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
@@ -0,0 +1,149 @@
+import heapq
+import threading
+import time
+
+
+class PendingRequest(object):
+    """
+    A request awaiting its final response.
+    """
+    __slots__ = ("request", "handler", "sent_at", "deadline")
+
+    def __init__(self, request, handler, sent_at, deadline):
+        self.request = request
+        self.handler = handler
+        self.sent_at = sent_at
+        self.deadline = deadline
+
+
+class PendingRequests(object):
+    """
+    Bounded registry of requests awaiting responses, keyed by seq.
+
+    Each request gets a deadline from the timeout for its tag, restarted by
+    every partial response. A timer thread, started on first use, keeps the
+    deadlines in a heap and passes each request which misses its deadline
+    to on_expired(seq, pending_request), having removed it.
+
+    At most max_in_flight requests are registered; add() refuses more, so a
+    backend which stops answering can't grow memory without bound.
+    """
+    # Seconds to wait for a response, by request tag. Session updates may
+    # compile a whole project between progress messages.
+    TIMEOUTS = {
+            "RequestUpdateSession": 600.0,
+            "RequestGetSourceErrors": 60.0,
+            "RequestGetLoadedModules": 60.0
+            }
+    DEFAULT_TIMEOUT = 30.0
+
+    def __init__(self, on_expired, max_in_flight=256, timeouts=None, default_timeout=None):
+        self._on_expired = on_expired
+        self.max_in_flight = max_in_flight
+        self.timeouts = dict(self.TIMEOUTS, **(timeouts or {}))
+        self.default_timeout = default_timeout if default_timeout is not None else self.DEFAULT_TIMEOUT
+        self._requests = {}
+        # (deadline, seq); entries whose request has gone or has a later
+        # deadline are skipped when they come up.
+        self._deadlines = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+
+    def add(self, seq, request, handler):
+        """
+        Register a request, returning False if max_in_flight are already
+        pending.
+        """
+        now = time.monotonic()
+        with self._condition:
+            if len(self._requests) >= self.max_in_flight:
+                return False
+            entry = PendingRequest(request, handler, now, now + self._timeout(request["tag"]))
+            self._requests[seq] = entry
+            self._schedule(seq, entry)
+        return True
+
+
+    def get(self, seq):
+        return self._requests.get(seq)
+
+
+    def pop(self, seq):
+        with self._condition:
+            return self._requests.pop(seq, None)
+
+
+    def refresh(self, seq):
+        """
+        Restart the deadline of a request, e.g. on a partial response.
+        """
+        with self._condition:
+            entry = self._requests.get(seq)
+            if entry is not None:
+                entry.deadline = time.monotonic() + self._timeout(entry.request["tag"])
+                self._schedule(seq, entry)
+
+
+    def items(self):
+        """
+        Return a list of (seq, PendingRequest) for every pending request.
+        """
+        with self._condition:
+            return list(self._requests.items())
+
+
+    def __len__(self):
+        return len(self._requests)
+
+
+    def close(self):
+        """
+        Stop the timer thread. Pending requests are kept.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+
+    def _timeout(self, tag):
+        return self.timeouts.get(tag, self.default_timeout)
+
+
+    def _schedule(self, seq, entry):
+        # Must be called with the condition held.
+        heapq.heappush(self._deadlines, (entry.deadline, seq))
+        if len(self._deadlines) > 4 * len(self._requests) + 64:
+            # Mostly answered requests: drop their deadlines.
+            self._deadlines = [(e.deadline, s) for (s, e) in self._requests.items()]
+            heapq.heapify(self._deadlines)
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._expire, name="stack-ide timeouts")
+            self._thread.daemon = True
+            self._thread.start()
+        elif self._deadlines[0][1] == seq:
+            # The earliest deadline has moved forward.
+            self._condition.notify()
+
+
+    def _expire(self):
+        while True:
+            expired = []
+            with self._condition:
+                while not self._closed:
+                    now = time.monotonic()
+                    while self._deadlines and self._deadlines[0][0] <= now:
+                        (deadline, seq) = heapq.heappop(self._deadlines)
+                        entry = self._requests.get(seq)
+                        if entry is not None and entry.deadline == deadline:
+                            del self._requests[seq]
+                            expired.append((seq, entry))
+                    if expired:
+                        break
+                    timeout = self._deadlines[0][0] - now if self._deadlines else None
+                    self._condition.wait(timeout)
+                if self._closed and not expired:
+                    return
+            for (seq, entry) in expired:
+                self._on_expired(seq, entry)
@@ -0,0 +1,802 @@
+import collections
+import json
+import os
+import subprocess
+import threading
+import time
+
+try:
+    from stack_ide.common import *
+except ImportError:
+    from common import *
+
+class ExpTypesHandler(object):
+    """
+    Echo expression types and highlight their spans.
+
+    Each update is sent to Neovim as a single call_atomic batch, so the RPC
+    cost does not depend on how many lines the span covers.
+    """
+    HIGHLIGHT_GROUP = 'Visual'
+    NAMESPACE = 'stack_ide_exp_types'
+
+    def __init__(self, vim, debug):
+        self.vim = vim
+        self.debug = debug
+
+        self.namespace = None
+        self.highlighted_buffer = None
+        self.types = None
+        self.types_index = 0
+
+
+    def __call__(self, tag, types):
+        """
+        Highlight the first expression type provided and echo the type to the status bar.
+
+        Called on the session's dispatcher thread; the types are handed to
+        Neovim's loop, where all of this handler's state is kept.
+        """
+        if types:
+            def go():
+                self.types = types
+                self.types_index = 0
+                self._show_type()
+            self.threadsafe_call(go)
+
+        # We expect only a single response.
+        return 'done'
+
+
+    def threadsafe_call(self, fn):
+        self.vim.session.threadsafe_call(fn)
+
+
+    def show_type(self):
+        """
+        Echo the current type and replace the highlight with its span.
+        """
+        self.threadsafe_call(self._show_type)
+
+
+    def _show_type(self):
+        exp_type = self.types[self.types_index]
+        buffer = self.vim.current.buffer.number
+        calls = [["nvim_command", ["echomsg '{0}'".format(exp_type.type)]]]
+        calls.extend(self._clear_highlight_calls())
+        calls.extend(self._highlight_calls(buffer, exp_type.span))
+        self.highlighted_buffer = buffer
+        self._call_atomic(calls)
+
+
+    def clear_highlight(self):
+        def go():
+            self._call_atomic(self._clear_highlight_calls())
+            self.highlighted_buffer = None
+        self.threadsafe_call(go)
+
+
+    def reset_exp_types(self):
+        self.clear_highlight()
+        # Set the index to one less than the start value as expand_exp_types
+        # will increment it before doing anything.
+        self.types_index = - 1
+
+
+    def expand_exp_types(self):
+        if self.types is not None:
+            self.types_index += 1
+            if self.types_index >= len(self.types):
+                self.types_index = 0
+            self.show_type()
+
+
+    def _namespace(self):
+        if self.namespace is None:
+            self.namespace = self.vim.api.create_namespace(self.NAMESPACE)
+        return self.namespace
+
+
+    def _clear_highlight_calls(self):
+        if self.highlighted_buffer is None:
+            return []
+        return [["nvim_buf_clear_namespace",
+                [self.highlighted_buffer, self._namespace(), 0, -1]]]
+
+
+    def _highlight_calls(self, buffer, span):
+        """
+        Return the API calls highlighting span. Lines and columns from
+        stack-ide are 1-based with an exclusive end column, whereas
+        nvim_buf_add_highlight is 0-based and uses -1 for the end of the line.
+        """
+        (_file_path, from_line, to_line, from_column, to_column) = span
+        namespace = self._namespace()
+
+        def add_highlight(line, col_start, col_end):
+            return ["nvim_buf_add_highlight",
+                    [buffer, namespace, self.HIGHLIGHT_GROUP, line - 1, col_start, col_end]]
+
+        if from_line == to_line:
+            return [add_highlight(from_line, from_column - 1, to_column - 1)]
+        calls = [add_highlight(from_line, from_column - 1, -1)]
+        for line in range(from_line + 1, to_line):
+            calls.append(add_highlight(line, 0, -1))
+        calls.append(add_highlight(to_line, 0, to_column - 1))
+        return calls
+
+
+    def _call_atomic(self, calls):
+        if not calls:
+            return
+        [_results, error] = self.vim.api.call_atomic(calls)
+        if error is not None:
+            self.debug.error("+ Highlight call failed: {0}".format(error))
+
+
+
+class SpanInfoHandler(object):
+    def __init__(self, vim, debug):
+        self.vim = vim
+        self.debug = debug
+
+        self.infos = None
+        # self.infos_index = 0
+
+
+    def __call__(self, tag, infos):
+        if infos:
+            def go():
+                self.infos = infos
+                # self.infos_index = 0
+                self.echo_info()
+            self.threadsafe_call(go)
+
+        return 'done'
+
+
+    def threadsafe_call(self, fn):
+        self.vim.session.threadsafe_call(fn)
+
+
+    def echo_info(self):
+        id_info = self.infos[0].id_info
+        if id_info is None:
+            # A quasi-quote.
+            return
+        msg = "{0}:{1}".format(id_info.package, id_info.module)
+        self.vim.command("echomsg '{0}'".format(msg))
+
+
+class DefinitionHandler(object):
+    """
+    Jump to the definition of an identifier, or echo where it comes from if
+    it has no source in the project.
+    """
+    def __init__(self, vim, debug, project_root):
+        self.vim = vim
+        self.debug = debug
+        self.project_root = project_root
+
+
+    def __call__(self, id_info):
+        if id_info is None:
+            self.threadsafe_call(lambda: self.vim.command("echomsg 'No identifier here'"))
+        elif id_info.definition is None:
+            msg = "{0} is defined in {1}:{2}".format(id_info.name, id_info.package, id_info.module)
+            self.threadsafe_call(lambda: self.vim.command("echomsg '{0}'".format(msg)))
+        else:
+            self.threadsafe_call(lambda: self.jump(id_info.definition))
+        return 'done'
+
+
+    def threadsafe_call(self, fn):
+        self.vim.session.threadsafe_call(fn)
+
+
+    def jump(self, span):
+        file_name = os.path.join(self.project_root, span.file_path)
+        [_results, error] = self.vim.api.call_atomic([
+            ["nvim_command", ["normal! m'"]],
+            ["nvim_command", ["edit {0}".format(self.vim.funcs.fnameescape(file_name))]],
+            ["nvim_win_set_cursor", [0, [span.from_line, span.from_column - 1]]]
+            ])
+        if error is not None:
+            self.debug.error("+ Jump to definition failed: {0}".format(error))
+
+
+class UpdateSessionHandler(object):
+    def __init__(self, vim, debug):
+        self._vim = vim
+        self._debug = debug
+
+
+    def __call__(self, tag, contents):
+        if contents.get("tag") == "UpdateStatusProgress":
+            msg = contents["contents"]["progressParsedMsg"]
+            self._out_write("{0}\n".format(msg))
+            return 'partial'
+        elif contents.get("tag") == "UpdateStatusDone":
+            return 'done'
+
+
+    def _threadsafe_call(self, fn):
+        self._vim.session.threadsafe_call(fn)
+
+    def _out_write(self, msg):
+        self._threadsafe_call(lambda: self._vim.out_write(msg))
+
+
+class SourceErrorsHandler(object):
+    """
+    Show a project's source errors in a quickfix list and as signs.
+
+    A project may have a session per target, each reporting only its own
+    errors. The latest errors of each session are kept, keyed by the targets
+    it loads, and the union of them is shown. A session's errors are dropped
+    when the pool evicts it.
+
+    Signs are diffed against the previous errors, so a rebuild only places
+    and removes the signs which changed. The quickfix list is only replaced
+    when the errors differ. Everything is sent as one call_atomic batch.
+    Buffers loaded later, e.g. from the quickfix list, get their signs from
+    buffer_loaded().
+    """
+    SIGN_GROUP = 'stack_ide'
+    SIGN_NAMES = {
+            'KindError': 'StackIdeError',
+            'KindServerDied': 'StackIdeError',
+            'KindWarning': 'StackIdeWarning'
+            }
+
+    def __init__(self, vim, debug, project_root):
+        self.vim = vim
+        self.debug = debug
+        self.project_root = project_root
+
+        self.diagnostics = DiagnosticSet()
+        # targets to the diagnostics of that session's latest refresh
+        self._session_diagnostics = collections.OrderedDict()
+        self.quickfix_id = None
+        self.signs_defined = False
+
+
+    def for_session(self, targets):
+        """
+        Return a response handler for the source errors of the session
+        loading targets.
+        """
+        def handle(tag, diagnostics):
+            if tag == 'ResponseGetSourceErrors':
+                self.threadsafe_call(lambda: self.show(targets, diagnostics))
+            return 'done'
+        return handle
+
+
+    def threadsafe_call(self, fn):
+        self.vim.session.threadsafe_call(fn)
+
+
+    def file_name(self, file_path):
+        return os.path.join(self.project_root, file_path)
+
+
+    def show(self, targets, session_diagnostics):
+        self._session_diagnostics[targets] = session_diagnostics
+        self._refresh()
+
+
+    def drop_session(self, targets):
+        """
+        Stop showing the errors of the session loading targets.
+        """
+        if self._session_diagnostics.pop(targets, None) is not None:
+            self._refresh()
+
+
+    def buffer_loaded(self, name):
+        """
+        Place the signs of the errors already shown in the file called name.
+        """
+        added = self.diagnostics.place_in(name, self.file_name)
+        if added:
+            self._call_atomic(self._place_calls(added))
+
+
+    def _refresh(self):
+        # Modules shared between targets report their errors in each session.
+        diagnostics = list(collections.OrderedDict.fromkeys(
+                d for ds in self._session_diagnostics.values() for d in ds))
+        previous = self.diagnostics.diagnostics
+        loaded = set(self.vim.eval("map(getbufinfo({'bufloaded': 1}), 'v:val.name')"))
+        added, removed = self.diagnostics.update(diagnostics, self.file_name, loaded)
+
+        calls = []
+        if removed:
+            unplace = [{"group": self.SIGN_GROUP, "id": sign_id, "buffer": name}
+                    for (sign_id, name) in removed]
+            calls.append(["nvim_call_function", ["sign_unplacelist", [unplace]]])
+        if added:
+            calls.extend(self._place_calls(added))
+        if diagnostics != previous:
+            calls.extend(self._quickfix_calls(diagnostics))
+        if calls:
+            self._call_atomic(calls)
+
+
+    def _place_calls(self, added):
+        calls = []
+        if not self.signs_defined:
+            calls.append(self._define_signs_call())
+            self.signs_defined = True
+        place = [{"group": self.SIGN_GROUP, "id": sign_id, "buffer": name,
+                  "name": self.SIGN_NAMES.get(d.kind, 'StackIdeError'), "lnum": d.from_line}
+                for (sign_id, name, d) in added]
+        calls.append(["nvim_call_function", ["sign_placelist", [place]]])
+        return calls
+
+
+    def _define_signs_call(self):
+        signs = [
+                {"name": "StackIdeError", "text": "E>", "texthl": "ErrorMsg"},
+                {"name": "StackIdeWarning", "text": "W>", "texthl": "WarningMsg"}
+                ]
+        return ["nvim_call_function", ["sign_define", [signs]]]
+
+
+    def _quickfix_calls(self, diagnostics):
+        items = []
+        for d in diagnostics:
+            item = {"text": d.message, "type": 'W' if d.kind == 'KindWarning' else 'E'}
+            if d.file_path is not None:
+                item.update(filename=self.file_name(d.file_path),
+                        lnum=d.from_line, col=d.from_column,
+                        end_lnum=d.to_line, end_col=d.to_column)
+            items.append(item)
+        what = {"title": "stack-ide: {0}".format(self.project_root), "items": items}
+        if self.quickfix_id is None:
+            return [["nvim_call_function", ["setqflist", [[], ' ', what]]],
+                    ["nvim_call_function", ["getqflist", [{"id": 0}]]]]
+        what["id"] = self.quickfix_id
+        return [["nvim_call_function", ["setqflist", [[], 'r', what]]]]
+
+
+    def _call_atomic(self, calls):
+        [results, error] = self.vim.api.call_atomic(calls)
+        if error is not None:
+            self.debug.error("+ Source errors call failed: {0}".format(error))
+            return
+        if self.quickfix_id is None:
+            if isinstance(results[-1], dict):
+                self.quickfix_id = results[-1].get("id")
+        elif results[-1] == -1:
+            # Our quickfix list has dropped out of the quickfix history.
+            self.quickfix_id = None
+            self._call_atomic(self._quickfix_calls(self.diagnostics.diagnostics))
+
+
+class StackIdePlugin(object):
+    """
+    Expose Stack IDE API to NeoVim.
+
+    Makes requests to Stack IDE API and dispatches reponses to handler
+    callables. The host-facing StackIde in __init__.py creates this on first
+    use and forwards each autocmd and command to the method of the same
+    name.
+    """
+    def __init__(self, vim):
+        self.vim = vim
+        # Off until configured from g:stack_ide_debug.
+        self.debug = DebugLog()
+
+        # Live stack-ide sessions, keyed by (project_root, target), or by
+        # (project_root, targets) for multiplexed sessions.
+        self.pool = SessionPool(self._boot_api, self.debug, on_evict=self._session_evicted)
+        self.stack_paths = StackPathCache(get_stack_path, self.debug)
+        # Every session's responses are handled on this one thread.
+        self.dispatcher = Dispatcher(self.debug)
+        self._configured = False
+        self._prewarm = True
+        self._multiplex = False
+        self._result_store = True
+
+        # Callables to handle updating vim.
+        #
+        # Pulling these out of this class allows them to maintain state
+        # without having to worry about name clashes.
+        self.exp_types_handler = ExpTypesHandler(vim, self.debug)
+        self.span_info_handler = SpanInfoHandler(vim, self.debug)
+        self._update_session_handler = UpdateSessionHandler(vim, self.debug)
+        # Time spent in Neovim RPC round trips building span queries.
+        self._rpc_times = Histogram()
+        # Map of project_root to its SourceErrorsHandler.
+        self._source_errors_handlers = {}
+        self.buffer_sync = BufferSync(vim, self.debug, self.api_for_buffer,
+                self._update_session_handler)
+
+
+    def api_for_current_buffer(self):
+        return self.api_for_buffer(self.vim.current.buffer)
+
+
+    def api_for_buffer(self, buffer):
+        """
+        Return the API for buffer, rebooting its session if it has been
+        evicted from the pool.
+        """
+        (project_root, targets, stack_yaml) = self._session_key(buffer)
+        return self.pool.get(project_root, targets, stack_yaml)
+
+
+    def _session_key(self, buffer):
+        """
+        Return (project_root, targets, stack_yaml) of the session serving
+        buffer, where targets is its key in the pool.
+        """
+        target = buffer.vars['stack_ide_target']
+        project_root = buffer.vars['stack_ide_project_root']
+        stack_yaml = buffer.vars['stack_ide_stack_yaml']
+        return (project_root, self._session_targets(project_root, target, stack_yaml), stack_yaml)
+
+
+    def initialize_buffer(self, filename, buffer=None, changedtick=None):
+        self._ensure_configured()
+        if buffer is None:
+            buffer = self.vim.current.buffer
+        target, project_root, stack_yaml = self.determine_stack_ide_vars(filename, buffer)
+        api = self._session_for(project_root, target, stack_yaml)
+        if changedtick is not None:
+            self._file_loaded(api, filename, project_root, changedtick)
+        handler = self._source_errors_handlers.get(project_root)
+        if handler is not None:
+            handler.buffer_loaded(buffer.name)
+
+
+    def file_written(self, filename, buffer, changedtick):
+        project_root = buffer.vars.get('stack_ide_project_root')
+        if project_root is None:
+            return
+        self._file_loaded(self.api_for_buffer(buffer), filename, project_root, changedtick)
+
+
+    def _file_loaded(self, api, filename, project_root, changedtick):
+        """
+        Tell api that the buffer for filename matches the file on disk, so
+        that stored results for it can be used and its results stored.
+        """
+        path = os.path.abspath(filename)
+        file_path = os.path.relpath(path, project_root)
+        api.file_loaded(file_path, changedtick, content_hash(path))
+
+
+    def _session_for(self, project_root, target, stack_yaml):
+        """
+        Return the API serving target.
+        """
+        return self.pool.get(project_root, self._session_targets(project_root, target, stack_yaml),
+                stack_yaml)
+
+
+    def _session_targets(self, project_root, target, stack_yaml):
+        """
+        Return the targets of the session serving target: target itself, or
+        a tuple of every target of its project.
+
+        With g:stack_ide_multiplex set, one session per project loads all of
+        its targets, and each buffer's b:stack_ide_target is only a view on
+        it. Shared library modules are then loaded into GHC once rather than
+        once per target.
+        """
+        if self._multiplex and target:
+            index = project_index(project_root, stack_yaml)
+            # Targets outside the project's packages still get a session of
+            # their own.
+            if target.split(":")[0] in set(name for (_dir, name) in index.packages):
+                return tuple(index.targets)
+        return target
+
+
+    def prewarm(self, directory):
+        """
+        Start a session for the stack project containing directory, if any,
+        so that it has loaded by the time the first buffer needs it.
+        """
+        self._ensure_configured()
+        if not self._prewarm:
+            return
+        if not any(os.path.isfile(os.path.join(path, "stack.yaml")) for path in walkup(directory)):
+            return
+        # `stack path` may take a while on a cold cache.
+        thread = threading.Thread(target=self._prewarm_project, args=(directory,))
+        thread.daemon = True
+        thread.start()
+
+
+    def _prewarm_project(self, directory):
+        try:
+            project_root, stack_yaml = self.stack_paths.lookup(directory)
+        except (OSError, subprocess.SubprocessError) as exc:
+            self.debug.warning("+ Not pre-warming {0}: {1}".format(directory, exc))
+            return
+        target = project_index(project_root, stack_yaml).default_target(directory)
+        self.debug("+ Pre-warming {0} {1}".format(project_root, target))
+        self._session_for(project_root, target, stack_yaml)
+
+
+    def _ensure_configured(self):
+        """
+        Read the g:stack_ide_* options. This is deferred until the first
+        Haskell buffer so that loading the plugin makes no requests to Neovim.
+        """
+        if self._configured:
+            return
+        self._configured = True
+        options = self.vim.vars
+        self.debug.configure(
+                level=options.get('stack_ide_debug'),
+                path=options.get('stack_ide_log_file'),
+                max_bytes=options.get('stack_ide_log_max_bytes', 5 * 2**20),
+                max_payload=options.get('stack_ide_log_max_payload', 2000))
+        self.pool.max_sessions = options.get('stack_ide_max_sessions', self.pool.max_sessions)
+        self.pool.idle_timeout = options.get('stack_ide_session_idle_timeout', self.pool.idle_timeout)
+        self.buffer_sync.delay = options.get('stack_ide_sync_delay', 300) / 1000.0
+        self._prewarm = bool(options.get('stack_ide_prewarm', 1))
+        self._multiplex = bool(options.get('stack_ide_multiplex', 0))
+        self._result_store = bool(options.get('stack_ide_result_store', 1))
+
+
+    def _boot_api(self, project_root, targets, stack_yaml):
+        api = stack_ide_api_for(project_root, targets, stack_yaml, self._default_handler, self.debug,
+                dispatcher=self.dispatcher)
+        api.add_update_listener(lambda: self._refresh_source_errors(api, project_root, targets))
+        if self._result_store:
+            api.attach_store(ResultStore(project_root, targets, self.debug))
+        # Load the target now; span queries made meanwhile wait for it.
+        api.warm_up(self._update_session_handler).add_done_callback(self._on_request_done)
+        return api
+
+
+    def _source_errors_handler(self, project_root):
+        handler = self._source_errors_handlers.get(project_root)
+        if handler is None:
+            handler = SourceErrorsHandler(self.vim, self.debug, project_root)
+            self._source_errors_handlers[project_root] = handler
+        return handler
+
+
+    def _session_evicted(self, project_root, targets):
+        """
+        Drop the source errors of a session the pool has evicted. Called
+        with the pool's lock held.
+        """
+        handler = self._source_errors_handlers.get(project_root)
+        if handler is not None:
+            handler.threadsafe_call(lambda: handler.drop_session(targets))
+
+
+    def _refresh_source_errors(self, api, project_root, targets):
+        """
+        Fetch the source errors once stack-ide has finished updating its
+        session. Called on the session's reader thread.
+        """
+        future = api.get_source_errors(self._source_errors_handler(project_root).for_session(targets))
+        future.add_done_callback(self._on_request_done)
+
+
+    def determine_stack_ide_vars(self, filename, buffer=None):
+        if buffer is None:
+            buffer = self.vim.current.buffer
+        target = buffer.vars.get('stack_ide_target')
+        project_root = buffer.vars.get('stack_ide_project_root')
+        stack_yaml = buffer.vars.get('stack_ide_stack_yaml')
+
+        file_dir = os.path.dirname(os.path.realpath(filename))
+        if project_root is None or stack_yaml is None:
+            found_root, found_yaml = self.stack_paths.lookup(file_dir)
+            if project_root is None:
+                project_root = found_root
+                buffer.vars['stack_ide_project_root'] = project_root
+            if stack_yaml is None:
+                stack_yaml = found_yaml
+                buffer.vars['stack_ide_stack_yaml'] = stack_yaml
+
+        # target is the package component the file belongs to, found from
+        # the project's stack.yaml and cabal files. If the file is in none of
+        # them the empty target makes stack-ide load every package; set
+        # b:stack_ide_target to choose one instead.
+        if target is None:
+            target = guess_stack_target(filename, project_root, stack_yaml)
+            if target is None:
+                self.debug("+ No target found for {0}; loading all packages".format(filename))
+                target = ''
+            buffer.vars['stack_ide_target'] = target
+
+        return target, project_root, stack_yaml
+
+
+    def autocmd_handler(self, args):
+        [filename, buffer_number, changedtick] = args
+        self.initialize_buffer(filename, self.vim.buffers[int(buffer_number)], changedtick)
+
+
+    def buffer_write_handler(self, args):
+        [filename, buffer_number, changedtick] = args
+        self.file_written(filename, self.vim.buffers[int(buffer_number)], changedtick)
+
+
+    def prewarm_handler(self, directory):
+        self.prewarm(directory)
+
+
+    def text_changed_handler(self, args):
+        [buffer_number, changedtick] = args
+        self.buffer_sync.buffer_changed(int(buffer_number), changedtick)
+
+
+    def buffer_unload_handler(self, buffer_number):
+        self.buffer_sync.buffer_unloaded(int(buffer_number))
+
+
+    def vim_leave_handler(self):
+        self.pool.end_all()
+        self.debug.close()
+
+
+    def clear_path_cache(self):
+        self.stack_paths.invalidate()
+
+
+    def stack_ide_status(self):
+        lines = []
+        for session in self.pool.status():
+            rss = session["rss"]
+            row = dict(session,
+                    rss="{0:.0f} MB".format(rss / 2**20) if rss is not None else "RSS unknown",
+                    targets=describe_targets(session["target"]))
+            lines.append("{project_root} {targets}: pid {pid}, {rss}, idle {idle:.0f}s, {pending} pending\n".format(
+                **row))
+        if not lines:
+            lines = ["No stack-ide sessions running\n"]
+        self.vim.out_write("".join(lines))
+
+
+    def get_source_errors(self):
+        (project_root, targets, stack_yaml) = self._session_key(self.vim.current.buffer)
+        handler = self._source_errors_handler(project_root).for_session(targets)
+        future = self.pool.get(project_root, targets, stack_yaml).get_source_errors(handler)
+        future.add_done_callback(self._on_request_done)
+
+
+    def get_loaded_modules(self):
+        future = self.api_for_current_buffer().get_loaded_modules()
+        future.add_done_callback(self._on_request_done)
+
+
+    def expand_exp_types(self):
+        self.exp_types_handler.expand_exp_types()
+
+
+    def clear_exp_types_highlight(self):
+        self.exp_types_handler.reset_exp_types()
+
+
+    def get_exp_types(self):
+        source_span, changedtick = self._cursor_span()
+        handler = self.exp_types_handler
+        future = self.api_for_current_buffer().get_exp_types(
+                source_span, handler, changedtick)
+        future.add_done_callback(self._on_request_done)
+
+
+    def get_span_info(self):
+        source_span, changedtick = self._cursor_span()
+        handler = self.span_info_handler
+        future = self.api_for_current_buffer().get_span_info(
+                source_span, handler, changedtick)
+        future.add_done_callback(self._on_request_done)
+
+
+    def go_to_definition(self):
+        source_span, changedtick = self._cursor_span()
+        handler = DefinitionHandler(self.vim, self.debug,
+                self.vim.current.buffer.vars['stack_ide_project_root'])
+        future = self.api_for_current_buffer().get_definition(
+                source_span, handler, changedtick)
+        future.add_done_callback(self._on_request_done)
+
+
+    def find_identifier(self, args):
+        lines = []
+        for id_info in self.api_for_current_buffer().find_identifier(args[0]):
+            location = ""
+            if id_info.definition is not None:
+                location = " at {0}:{1}".format(id_info.definition.file_path,
+                        id_info.definition.from_line)
+            lines.append("{0} :: {1} ({2}:{3}){4}\n".format(id_info.name, id_info.type,
+                id_info.package, id_info.module, location))
+        if not lines:
+            lines = ["{0} hasn't been seen yet\n".format(args[0])]
+        self.vim.out_write("".join(lines))
+
+
+    def cache_stats(self):
+        api = self.api_for_current_buffer()
+        stats = dict(api.cache_stats(), **api.coalescing_stats())
+        msg = ("stack-ide cache: {hits} hits, {misses} misses, {size}/{max_size} entries; "
+                "{dropped} superseded responses dropped").format(**stats)
+        self.vim.command("echomsg '{0}'".format(msg))
+
+
+    def stack_ide_stats(self, args):
+        """
+        Show request statistics for every session, or write them as JSON to
+        the file given as an argument.
+        """
+        sessions = [{"project_root": project_root, "target": target, "stats": api.stats()}
+                for ((project_root, target), api) in self.pool.sessions()]
+        if args:
+            with open(os.path.expanduser(args[0]), 'w') as f:
+                json.dump({"neovim_rpc": self._rpc_times.summary(), "sessions": sessions}, f, indent=2)
+            return
+
+        lines = ["neovim rpc: {0}".format(format_summary(self._rpc_times.summary()))]
+        for session in sessions:
+            stats = session["stats"]
+            lines.append("{0} {1}:".format(session["project_root"], describe_targets(session["target"])))
+            lines.append("  {pending} pending (depth p95 {depth}), {bytes_out} bytes out, {bytes_in} bytes in".format(
+                depth=stats["pending_depth"].get("p95", 0), **stats))
+            for (name, summary) in sorted(stats["timings"].items()):
+                lines.append("  {0}: {1}".format(name, format_summary(summary)))
+            for (tag, request) in sorted(stats["requests"].items()):
+                lines.append("  {0}: first {1}; final {2}; {3} partials; {4} timeouts".format(
+                    tag, format_summary(request["first_response"]),
+                    format_summary(request["latency"]), request["partials"],
+                    request["timeouts"]))
+            lines.append("  cache: {hits} hits, {misses} misses; {dropped} superseded dropped".format(
+                **dict(stats["cache"], **stats["coalescing"])))
+            scheduler = stats["scheduler"]
+            lines.append("  scheduler: queued {0}; {1} promoted".format(
+                ", ".join("{0} {1}".format(n, scheduler["queued"][n]) for n in sorted(scheduler["queued"])),
+                scheduler["promoted"]))
+            if "store" in stats:
+                lines.append("  store: {files} files".format(**stats["store"]))
+        self.vim.out_write("\n".join(lines) + "\n")
+
+
+    def _cursor_span(self):
+        """
+        Return a SourceSpan for the cursor position and the buffer's
+        changedtick.
+        """
+        started = time.perf_counter()
+        project_root = self.vim.current.buffer.vars['stack_ide_project_root']
+        s = '[substitute(expand("%:p"), "{0}" . "/", "", ""), b:changedtick]'.format(project_root)
+        [filename, changedtick] = self.vim.eval(s)
+
+        [line, col] = self.vim.current.window.cursor
+        self._rpc_times.add(time.perf_counter() - started)
+        return SourceSpan(filename, line, line, col+1, col+2), changedtick
+
+
+    def _on_request_done(self, future):
+        """
+        Log requests which failed; successful responses have already been
+        applied by their handlers.
+        """
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            self.debug.warning("+ Request failed: {0}".format(exc))
+
+
+    def _default_handler(self, tag, contents):
+        if tag == 'ResponseInvalidRequest':
+            self.debug.warning("+ Invalid request")
+        elif tag == 'ResponseWelcome':
+            # self._stack_ide_api_version = contents
+            pass
+        elif tag == 'ResponseUpdateSession':
+            self._update_session_handler(tag, contents)
+        else:
+            self.debug("+ Unhandled response {0}".format(tag))
@@ -0,0 +1,178 @@
+import os
+import subprocess
+import threading
+import time
+
+
+class SessionPool(object):
+    """
+    Pool of stack-ide sessions keyed by (project_root, target), where target
+    may also be a tuple of targets sharing one session.
+
+    Each session holds a full GHC session, so at most max_sessions are kept
+    alive. Booting one more evicts the least recently used idle session, and
+    sessions unused for longer than idle_timeout seconds are ended as well.
+    Evicted sessions, and sessions whose process died for good, are booted
+    again the next time they are asked for.
+    """
+    def __init__(self, boot, debug, max_sessions=3, idle_timeout=None, on_evict=None):
+        # boot(project_root, target or targets, stack_yaml) -> StackIdeApi
+        self._boot = boot
+        self._debug = debug
+        # on_evict(project_root, target or targets), called with the lock
+        # held after a session has been evicted or ended for being idle.
+        self._on_evict = on_evict
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, project_root, target, stack_yaml):
+        """
+        Return the API for (project_root, target), booting it if need be.
+        """
+        key = (project_root, target)
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None and not entry.api.is_alive():
+                self._debug("+ Session {0} died; booting a new one".format(key))
+                del self._sessions[key]
+                entry = None
+            if entry is None:
+                entry = _PooledSession(self._boot(project_root, target, stack_yaml))
+                self._sessions[key] = entry
+            entry.touch()
+            self._evict(keep=key)
+            return entry.api
+
+
+    def sessions(self):
+        """
+        Return a list of ((project_root, target), api) for each live session.
+        """
+        with self._lock:
+            return [(key, entry.api) for key, entry in self._sessions.items()]
+
+
+    def end_all(self):
+        with self._lock:
+            for key in list(self._sessions):
+                self._end(key)
+
+
+    def status(self):
+        """
+        Return a list of dicts describing each live session.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entries = sorted(self._sessions.items(), key=lambda item: -item[1].last_used)
+        report = []
+        for ((project_root, target), entry) in entries:
+            pid = entry.api.pid
+            report.append({
+                "project_root": project_root,
+                "target": target,
+                "pid": pid,
+                "rss": process_tree_rss(pid) if pid is not None else None,
+                "idle": now - entry.last_used,
+                "pending": entry.api.pending_count()
+                })
+        return report
+
+
+    def _evict(self, keep):
+        # Must be called with the lock held.
+        now = time.monotonic()
+        if self.idle_timeout:
+            for key, entry in list(self._sessions.items()):
+                if key != keep and now - entry.last_used > self.idle_timeout and entry.api.is_idle():
+                    self._debug("+ Ending session {0} after {1:.0f}s idle".format(
+                        key, now - entry.last_used))
+                    self._evicted(key)
+
+        candidates = sorted(
+                (entry.last_used, key) for key, entry in self._sessions.items()
+                if key != keep and entry.api.is_idle())
+        while len(self._sessions) > self.max_sessions and candidates:
+            (_last_used, key) = candidates.pop(0)
+            self._debug("+ Evicting least recently used session {0}".format(key))
+            self._evicted(key)
+        if len(self._sessions) > self.max_sessions:
+            self._debug("+ {0} sessions live, all busy; not evicting".format(len(self._sessions)))
+
+
+    def _end(self, key):
+        entry = self._sessions.pop(key)
+        entry.api.end()
+
+
+    def _evicted(self, key):
+        self._end(key)
+        if self._on_evict is not None:
+            self._on_evict(*key)
+
+
+class _PooledSession(object):
+    def __init__(self, api):
+        self.api = api
+        self.last_used = time.monotonic()
+
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+
+def process_tree_rss(pid):
+    """
+    Return the resident set size in bytes of pid and all its descendants.
+
+    `stack ide start` runs stack-ide (and GHC) as child processes, so the
+    memory of interest is spread over the tree. Returns None if it cannot be
+    determined.
+    """
+    if os.path.isdir("/proc"):
+        return _proc_tree_rss(pid)
+    try:
+        output = subprocess.check_output(
+                ["ps", "-o", "rss=", "-p", str(pid)], universal_newlines=True, timeout=2)
+        return int(output.strip()) * 1024
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def _proc_tree_rss(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{0}/stat".format(entry)) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, so split after its closing paren.
+        ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    total = None
+    todo = [pid]
+    while todo:
+        current = todo.pop()
+        rss = _proc_rss(current)
+        if rss is not None:
+            total = (total or 0) + rss
+        todo.extend(children.get(current, []))
+    return total
+
+
+def _proc_rss(pid):
+    try:
+        with open("/proc/{0}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
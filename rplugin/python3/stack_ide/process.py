@@ -3,26 +3,47 @@ import sys
 import threading
 import traceback
 
+try:
+    from stack_ide.framing import LineFramer
+except ImportError:
+    from framing import LineFramer
 
-def boot_stack_ide_process(project_root, target, stack_yaml_path, debug):
+
+def boot_stack_ide_process(project_root, targets, stack_yaml_path, debug):
     """
     Return a Process object for starting a stack ide session.
 
-    The process has not been launched.
+    targets is a target or a sequence of targets to load into the one
+    session. An empty target loads every package in the project. The
+    process has not been launched.
     """
-    msg = "+ Launching stack-ide instance in {0} for target {1} using config {2}".format(
-            project_root, target, stack_yaml_path)
+    msg = "+ Launching stack-ide instance in {0} for {1} using config {2}".format(
+            project_root, describe_targets(targets), stack_yaml_path)
     debug(msg)
 
     process = Process(
             name="stack ide",
-            process_args=["stack", "--stack-yaml", stack_yaml_path, "ide", "start", target],
+            process_args=["stack", "--stack-yaml", stack_yaml_path, "ide", "start"] + target_args(targets),
             cwd=project_root,
             debug=debug
             )
     return process
 
 
+def target_args(targets):
+    """
+    Return the `stack ide start` arguments for a target or sequence of
+    targets.
+    """
+    if isinstance(targets, str):
+        targets = [targets]
+    return [target for target in targets if target]
+
+
+def describe_targets(targets):
+    return " ".join(target_args(targets)) or "all packages"
+
+
 class Process(object):
     """
     Manages a single process.
@@ -31,19 +52,28 @@ class Process(object):
     - Provides low-level method for making requests.
     - Calls given response_handler with result.
     """
+    # Bytes to ask for per read of stdout.
+    READ_SIZE = 256 * 1024
+
     def __init__(self, name, process_args, cwd, debug):
         self._name = name
         self._process_args = process_args
         self._cwd = cwd
         self._debug = debug
+        self._process = None
+        self._send_lock = threading.Lock()
 
 
-    def run(self, on_stdout_line, on_stderr_line):
+    def run(self, on_stdout_line, on_stderr_line, on_exit=None):
         """
         Start a subprocess and threads to consume its stdout and stderr.
+
+        on_exit, if given, is called with the process's return code once its
+        stdout has closed and it has exited, whatever the reason.
         """
         self._on_stdout_line = on_stdout_line
         self._on_stderr_line = on_stderr_line
+        self._on_exit = on_exit
         msg = "+ Launching process {0} as {1}".format(self._name, self._process_args)
         self._debug(msg)
 
@@ -53,69 +83,113 @@ class Process(object):
                 cwd=self._cwd
                 )
 
-        self.stdoutThread = threading.Thread(target=self._read_stdout)
+        # The reader threads are given this process, not self._process,
+        # which changes on restart.
+        self.stdoutThread = threading.Thread(target=self._read_stdout, args=(self._process,))
         self.stdoutThread.start()
 
-        self.stderrThread = threading.Thread(target=self._read_stderr)
+        self.stderrThread = threading.Thread(target=self._read_stderr, args=(self._process,))
         self.stderrThread.start()
 
 
-    def send(self, encodedString):
-        if self._process:
-            self._debug("> {0}".format(encodedString))
-            self._process.stdin.write(bytes(encodedString, 'UTF-8'))
-            self._process.stdin.flush()
-            return True
-        else:
-            self._debug("+ Couldn't send request, no process!")
+    def restart(self):
+        """
+        Start the process again with the same callbacks, after it has exited.
+        """
+        self.run(self._on_stdout_line, self._on_stderr_line, self._on_exit)
+
+
+    def send(self, encoded):
+        """
+        Write the bytes encoded to the process's stdin.
+        """
+        process = self._process
+        if process is None:
+            self._debug.warning("+ Couldn't send request, no process!")
             return False
+        self._debug.payload(">", encoded)
+        try:
+            # Requests may be sent from several threads.
+            with self._send_lock:
+                process.stdin.write(encoded)
+                process.stdin.flush()
+        except (OSError, ValueError) as exc:
+            # The process died under us; its stdout reader reports the exit.
+            self._debug.warning("+ Couldn't send request to {0}: {1}".format(self._name, exc))
+            return False
+        return True
+
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process is not None else None
 
 
     def is_running(self):
-        self._process is not None and self._process.poll() is None
+        process = self._process
+        return process is not None and process.poll() is None
 
 
     def terminate(self):
-        self._process.terminate()
-        self._process = None
+        """
+        Kill the process. Its stdout reader still reports the exit.
+        """
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.terminate()
 
 
-    def _read_stderr(self):
+    def _read_stderr(self, process):
         """
         Read and dispatch any errors.
         """
-        while self._process.poll() is None:
+        stderr = process.stderr
+        while True:
             try:
-                error = self._process.stderr.readline().decode('UTF-8')
-                self._debug(error)
+                error = stderr.readline().decode('UTF-8', 'replace')
+                if not error:
+                    # End of file: don't log an empty line per poll.
+                    break
+                self._debug.info(error)
                 if self._on_stderr_line is not None:
                     self._on_stderr_line(error)
             except:
-                self._debug("+ Process {0} ending due to exception: {1}".format(self._name, sys.exc_info()))
+                self._debug.error("+ Process {0} ending due to exception: {1}".format(self._name, sys.exc_info()))
                 return
         self._debug("+ Process {0} ended.".format(self._name))
 
 
-    def _read_stdout(self):
+    def _read_stdout(self, process):
         """
         Reads lines from stack-ide's output and dispatches them.
+
+        Output is read in large chunks and split into lines of bytes without
+        decoding, leaving parsing to the line handler. Once the output ends
+        the process is reaped and on_exit called.
         """
-        while self._process.poll() is None:
+        framer = LineFramer()
+        stdout = process.stdout
+        while True:
             try:
-                line = self._process.stdout.readline().decode('UTF-8')
-                if not line:
-                    return
-                self._debug("< {0}".format(line))
-                if self._on_stdout_line is not None:
-                    self._on_stdout_line(line)
+                chunk = stdout.read1(self.READ_SIZE)
+                lines = framer.feed(chunk) if chunk else framer.flush()
+                for line in lines:
+                    self._debug.payload("<", line)
+                    if self._on_stdout_line is not None:
+                        self._on_stdout_line(line)
+                if not chunk:
+                    break
             except:
                 exc = traceback.format_exception(*sys.exc_info())
-                self._debug("+ Process {0} ending due to exception: {1}".format(self._name, exc))
-                self.terminate()
-                return
-        self._debug("+ Process {0} ended.".format(self._name))
+                self._debug.error("+ Process {0} ending due to exception: {1}".format(self._name, exc))
+                if process.poll() is None:
+                    process.terminate()
+                break
+        returncode = process.wait()
+        self._debug("+ Process {0} ended with status {1}.".format(self._name, returncode))
+        if self._on_exit is not None:
+            self._on_exit(returncode)
 
 
     def __del__(self):
-        if self._process and (self._process.poll() is None):
-            self.terminate()
+        self.terminate()
@@ -0,0 +1,238 @@
+import glob
+import os
+import re
+import threading
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+# Cabal component stanzas and the stack target syntax for each.
+_COMPONENT_TARGETS = {
+        "library": "{package}:lib",
+        "executable": "{package}:exe:{name}",
+        "test-suite": "{package}:test:{name}",
+        "benchmark": "{package}:bench:{name}"
+        }
+
+_STANZA_RE = re.compile(r"^(library|executable|test-suite|benchmark)\b\s*(\S*)", re.IGNORECASE)
+_FIELD_RE = re.compile(r"^(\s*)([A-Za-z][A-Za-z0-9-]*)\s*:\s*(.*)$")
+
+
+class ProjectIndex(object):
+    """
+    Index from source directories to stack targets for a project.
+
+    Built once from the stack.yaml `packages:` list and the `hs-source-dirs`
+    of each package's cabal file. The index records the mtimes of those files
+    so callers can tell when it needs rebuilding.
+    """
+    def __init__(self, project_root, stack_yaml):
+        self.project_root = project_root
+        self.stack_yaml = stack_yaml
+        # (package dir, package name) pairs.
+        self.packages = []
+        # (source dir, target) pairs, longest source dir first.
+        self.source_dirs = []
+        self.targets = []
+        self._mtimes = {}
+        self._build()
+
+
+    def target_for(self, filename):
+        """
+        Return the target whose source directories contain filename.
+
+        Files outside any source directory, such as Setup.hs, map to their
+        package. Returns None for files outside every package.
+        """
+        path = os.path.realpath(filename)
+        for (source_dir, target) in self.source_dirs:
+            if path.startswith(source_dir):
+                return target
+        for (package_dir, package_name) in self.packages:
+            if path.startswith(package_dir):
+                return package_name
+        return None
+
+
+    def default_target(self, directory):
+        """
+        Return the target most likely to be wanted first when working in
+        directory: the one whose sources it holds, else the library of its
+        package, else the first library. Returns '' for a project without
+        targets.
+        """
+        path = os.path.realpath(directory) + os.sep
+        for (source_dir, target) in self.source_dirs:
+            if path.startswith(source_dir):
+                return target
+        libraries = [target for target in self.targets if target.endswith(":lib")]
+        for (package_dir, package_name) in self.packages:
+            if path.startswith(package_dir) and package_name + ":lib" in libraries:
+                return package_name + ":lib"
+        if libraries:
+            return libraries[0]
+        return self.targets[0] if self.targets else ''
+
+
+    def is_stale(self):
+        return any(_mtime(path) != mtime for path, mtime in self._mtimes.items())
+
+
+    def _build(self):
+        self._mtimes[self.stack_yaml] = _mtime(self.stack_yaml)
+        source_dirs = []
+        for package in read_stack_yaml_packages(self.stack_yaml):
+            package_dir = os.path.realpath(os.path.join(self.project_root, package))
+            cabal_files = sorted(glob.glob(os.path.join(glob.escape(package_dir), "*.cabal")))
+            if not cabal_files:
+                continue
+            cabal_file = cabal_files[0]
+            self._mtimes[cabal_file] = _mtime(cabal_file)
+            package_name, components = parse_cabal_file(cabal_file)
+            if package_name is None:
+                package_name = os.path.basename(cabal_file)[:-len(".cabal")]
+            self.packages.append((package_dir + os.sep, package_name))
+            for (kind, name, dirs) in components:
+                target = _COMPONENT_TARGETS[kind].format(package=package_name, name=name)
+                self.targets.append(target)
+                for d in dirs:
+                    source_dir = os.path.normpath(os.path.join(package_dir, d))
+                    # The library wins when components share a directory.
+                    source_dirs.append((len(source_dir), kind == "library", source_dir + os.sep, target))
+        source_dirs.sort(key=lambda entry: (entry[0], entry[1]), reverse=True)
+        self.source_dirs = [(source_dir, target) for (_, _, source_dir, target) in source_dirs]
+        self.packages.sort(key=lambda entry: len(entry[0]), reverse=True)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def project_index(project_root, stack_yaml):
+    """
+    Return the ProjectIndex for a project, rebuilding it if its stack.yaml
+    or cabal files have changed.
+    """
+    key = (project_root, stack_yaml)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None or index.is_stale():
+            index = ProjectIndex(project_root, stack_yaml)
+            _indexes[key] = index
+        return index
+
+
+def read_stack_yaml_packages(stack_yaml):
+    """
+    Return the local package directories listed in stack.yaml.
+    """
+    try:
+        with open(stack_yaml) as f:
+            text = f.read()
+    except OSError:
+        return []
+    if yaml is not None:
+        try:
+            config = yaml.safe_load(text) or {}
+        except yaml.YAMLError:
+            return []
+        packages = config.get("packages") or ["."]
+    else:
+        packages = _parse_packages(text)
+
+    dirs = []
+    for package in packages:
+        if isinstance(package, dict):
+            package = package.get("location")
+        if isinstance(package, str):
+            dirs.append(package)
+    return dirs
+
+
+def _parse_packages(text):
+    """
+    Minimal parser for the `packages:` list of stack.yaml, used when PyYAML
+    is not installed.
+    """
+    packages = None
+    for line in text.splitlines():
+        stripped = line.split("#", 1)[0].rstrip()
+        if not stripped:
+            continue
+        if packages is None:
+            if stripped.startswith("packages:"):
+                packages = []
+            continue
+        if not line[0].isspace() and not stripped.startswith("-"):
+            break
+        item = stripped.strip()
+        if item.startswith("-"):
+            item = item[1:].strip()
+        elif not item.startswith("location:"):
+            continue
+        if item.startswith("location:"):
+            item = item[len("location:"):].strip()
+        if item and not item.endswith(":"):
+            packages.append(item.strip("'\""))
+    return packages or ["."]
+
+
+def parse_cabal_file(cabal_file):
+    """
+    Return the package name and a list of (kind, name, hs_source_dirs) for
+    each component of a cabal file.
+    """
+    try:
+        with open(cabal_file) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None, []
+
+    package_name = None
+    components = []
+    current = None
+    field = None
+    field_indent = 0
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith("--"):
+            continue
+        indent = len(line) - len(line.lstrip())
+        if indent == 0:
+            field = None
+            stanza = _STANZA_RE.match(line)
+            if stanza:
+                current = [stanza.group(1).lower(), stanza.group(2), []]
+                components.append(current)
+                continue
+            current = None
+            match = _FIELD_RE.match(line)
+            if match and match.group(2).lower() == "name":
+                package_name = match.group(3).strip()
+            continue
+        if current is None:
+            continue
+        match = _FIELD_RE.match(line)
+        if match:
+            field = match.group(2).lower()
+            field_indent = indent
+            value = match.group(3)
+        elif field is not None and indent > field_indent:
+            value = line
+        else:
+            field = None
+            continue
+        if field == "hs-source-dirs":
+            current[2].extend(d for d in re.split(r"[\s,]+", value) if d)
+
+    return package_name, [(kind, name, dirs or ["."]) for (kind, name, dirs) in components]
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
@@ -0,0 +1,124 @@
+import collections
+import sys
+
+try:
+    from stack_ide.diagnostics import parse_source_errors
+except ImportError:
+    from diagnostics import parse_source_errors
+
+
+def intern(string):
+    """
+    Intern file paths, module names and the like, which recur in every
+    response.
+    """
+    return sys.intern(string) if string is not None else None
+
+
+class SourceSpan(collections.namedtuple(
+        'SourceSpan', 'file_path from_line to_line from_column to_column')):
+    """
+    A span of a source file. Lines and columns are 1-based and the end
+    column is exclusive, as in stack-ide.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, span):
+        return cls(intern(span["spanFilePath"]), span["spanFromLine"], span["spanToLine"],
+                span["spanFromColumn"], span["spanToColumn"])
+
+
+    @property
+    def start(self):
+        return (self.from_line, self.from_column)
+
+
+    @property
+    def end(self):
+        return (self.to_line, self.to_column)
+
+
+    def to_stack_ide_contents(self):
+        return {
+                "spanFilePath": self.file_path,
+                "spanFromLine": self.from_line,
+                "spanToLine": self.to_line,
+                "spanFromColumn": self.from_column,
+                "spanToColumn": self.to_column
+                }
+
+
+ExpType = collections.namedtuple('ExpType', 'type span')
+ExpType.__doc__ = """
+The type of the expression at span, from a RequestGetExpTypes response.
+"""
+
+IdInfo = collections.namedtuple('IdInfo', 'name space type module package definition')
+IdInfo.__doc__ = """
+An identifier from a span info response. definition is the SourceSpan of
+its definition, or None when it has no source span, e.g. for identifiers
+from other packages.
+"""
+
+SpanInfo = collections.namedtuple('SpanInfo', 'id_info span')
+SpanInfo.__doc__ = """
+An entry of a RequestGetSpanInfo response: the identifier at span, or None
+for a quasi-quote.
+"""
+
+
+def parse_exp_types(types):
+    return [ExpType(intern(type_string), SourceSpan.from_json(span))
+            for [type_string, span] in types or []]
+
+
+def parse_span_infos(infos):
+    return [SpanInfo(parse_id_info(info), SourceSpan.from_json(span))
+            for [info, span] in infos or []]
+
+
+def parse_id_info(info):
+    """
+    Return the IdInfo of a stack-ide SpanInfo, or None if it isn't a SpanId.
+    """
+    if info.get("tag") != "SpanId":
+        return None
+    props = info["contents"]["idProp"]
+    defined_in = props["idDefinedIn"]
+    def_span = props.get("idDefSpan") or {}
+    return IdInfo(
+            intern(props["idName"]),
+            intern(props.get("idSpace")),
+            intern(props.get("idType")),
+            intern(defined_in["moduleName"]),
+            intern(defined_in["modulePackage"]["packageName"]),
+            SourceSpan.from_json(def_span["contents"]) if def_span.get("tag") == "ProperSpan" else None)
+
+
+_PARSERS = {
+        "ResponseGetExpTypes": parse_exp_types,
+        "ResponseGetSpanInfo": parse_span_infos,
+        "ResponseGetSourceErrors": parse_source_errors,
+        "ResponseGetLoadedModules": lambda modules: [intern(module) for module in modules or []]
+        }
+
+
+def parse_contents(tag, contents):
+    """
+    Return the records for the contents of a response, or the contents
+    unchanged for responses without records.
+    """
+    parse = _PARSERS.get(tag)
+    return parse(contents) if parse is not None else contents
+
+
+def to_json(value):
+    """
+    Turn records back into JSON serialisable dicts and lists.
+    """
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        return dict((field, to_json(v)) for (field, v) in zip(value._fields, value))
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    return value
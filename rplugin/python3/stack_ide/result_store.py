@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    from stack_ide.path_cache import default_cache_dir
+    from stack_ide.process import describe_targets
+    from stack_ide.records import ExpType, IdInfo, SourceSpan, SpanInfo, intern
+except ImportError:
+    from path_cache import default_cache_dir
+    from process import describe_targets
+    from records import ExpType, IdInfo, SourceSpan, SpanInfo, intern
+
+
+def content_hash(path):
+    """
+    Return the hex digest of the contents of the file at path, or None if it
+    can't be read.
+    """
+    digest = hashlib.sha1()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class ResultStore(object):
+    """
+    Exp type and span info results of one (project_root, targets), kept on
+    disk between Neovim sessions.
+
+    Results are stored per source file along with the hash of the contents
+    they were returned for. A reopened file whose contents hash the same can
+    be answered from the store straight away, while stack-ide is still
+    loading the project; a stored entry whose hash no longer matches is
+    thrown away.
+
+    The store is read on first use and written back by save(), gzipped, as
+    compact JSON arrays rather than objects. Only the MAX_FILES most
+    recently used files are kept.
+    """
+    # 2: exp types carry the positions they answered, not an innermost flag.
+    VERSION = 2
+    MAX_FILES = 1000
+
+    def __init__(self, project_root, targets, debug, cache_dir=None):
+        self._debug = debug
+        if cache_dir is None:
+            cache_dir = os.path.join(default_cache_dir(), "results")
+        key = json.dumps([project_root, describe_targets(targets)])
+        self._store_file = os.path.join(cache_dir,
+                "{0}.json.gz".format(hashlib.sha1(key.encode("UTF-8")).hexdigest()))
+        # file path to {"hash", "used", "exp_types", "span_infos"}
+        self._files = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+
+    def lookup(self, file_path, content_hash):
+        """
+        Return ([(ExpType, positions)], [SpanInfo]) stored for file_path with
+        contents hashing to content_hash, or None. See SpanIndex.export().
+        """
+        with self._lock:
+            self._load()
+            entry = self._files.get(file_path)
+            if entry is None:
+                return None
+            if entry["hash"] != content_hash:
+                del self._files[file_path]
+                self._dirty = True
+                return None
+            entry["used"] = time.time()
+            self._dirty = True
+            try:
+                return (_decode_exp_types(entry["exp_types"]), _decode_span_infos(entry["span_infos"]))
+            except (KeyError, TypeError, ValueError) as exc:
+                self._debug.warning("+ Dropping stored results for {0}: {1}".format(file_path, exc))
+                del self._files[file_path]
+                return None
+
+
+    def update(self, file_path, content_hash, exp_types, span_infos):
+        """
+        Store ([(ExpType, positions)], [SpanInfo]) for file_path with
+        contents hashing to content_hash, adding to any results already
+        stored for the same contents.
+        """
+        if not exp_types and not span_infos:
+            return
+        with self._lock:
+            self._load()
+            entry = self._files.get(file_path)
+            if entry is not None and entry["hash"] == content_hash:
+                try:
+                    exp_types = _merge_exp_types(_decode_exp_types(entry["exp_types"]), exp_types)
+                    span_infos = _merge(_decode_span_infos(entry["span_infos"]), span_infos)
+                except (KeyError, TypeError, ValueError):
+                    pass
+            self._files[file_path] = {
+                    "hash": content_hash,
+                    "used": time.time(),
+                    "exp_types": [[t.type, list(t.span), [list(p) for p in positions]]
+                        for (t, positions) in exp_types],
+                    "span_infos": [[_encode_id_info(i.id_info), list(i.span)] for i in span_infos]
+                    }
+            self._dirty = True
+
+
+    def save(self):
+        """
+        Write the store back to disk if it has changed.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            if len(self._files) > self.MAX_FILES:
+                recent = sorted(self._files, key=lambda path: self._files[path]["used"])
+                for file_path in recent[:-self.MAX_FILES]:
+                    del self._files[file_path]
+            data = {"version": self.VERSION, "files": self._files}
+            tmp_file = "{0}.{1}.tmp".format(self._store_file, os.getpid())
+            try:
+                os.makedirs(os.path.dirname(self._store_file), exist_ok=True)
+                with gzip.open(tmp_file, "wt", encoding="UTF-8") as f:
+                    json.dump(data, f, separators=(",", ":"))
+                os.replace(tmp_file, self._store_file)
+            except OSError as exc:
+                self._debug.warning("+ Couldn't write {0}: {1}".format(self._store_file, exc))
+
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {"files": len(self._files)}
+
+
+    def _load(self):
+        # Must be called with the lock held.
+        if self._files is not None:
+            return
+        try:
+            with gzip.open(self._store_file, "rt", encoding="UTF-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        except (OSError, EOFError, ValueError) as exc:
+            self._debug.warning("+ Ignoring {0}: {1}".format(self._store_file, exc))
+            data = {}
+        if data.get("version") != self.VERSION:
+            data = {"files": {}}
+        self._files = data["files"]
+
+
+def _encode_id_info(id_info):
+    if id_info is None:
+        return None
+    definition = list(id_info.definition) if id_info.definition is not None else None
+    return list(id_info[:5]) + [definition]
+
+
+def _decode_span(span):
+    [file_path, from_line, to_line, from_column, to_column] = span
+    return SourceSpan(intern(file_path), from_line, to_line, from_column, to_column)
+
+
+def _decode_exp_types(entries):
+    return [(ExpType(intern(type_string), _decode_span(span)), [tuple(p) for p in positions])
+            for [type_string, span, positions] in entries]
+
+
+def _decode_span_infos(entries):
+    infos = []
+    for [id_info, span] in entries:
+        if id_info is not None:
+            [name, space, type_string, module, package, definition] = id_info
+            id_info = IdInfo(intern(name), intern(space), intern(type_string), intern(module),
+                    intern(package), _decode_span(definition) if definition is not None else None)
+        infos.append(SpanInfo(id_info, _decode_span(span)))
+    return infos
+
+
+def _merge_exp_types(old, new):
+    positions = {}
+    for (exp_type, answered) in old + list(new):
+        positions.setdefault(exp_type, set()).update(answered)
+    return [(exp_type, sorted(answered)) for (exp_type, answered) in positions.items()]
+
+
+def _merge(old, new):
+    seen = set(old)
+    return old + [info for info in new if info not in seen and not seen.add(info)]
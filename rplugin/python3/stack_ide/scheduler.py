@@ -0,0 +1,181 @@
+import collections
+import threading
+import time
+
+
+# Priority classes, highest first.
+INTERACTIVE = 0
+DIAGNOSTICS = 1
+BACKGROUND = 2
+
+CLASS_NAMES = {
+        INTERACTIVE: "interactive",
+        DIAGNOSTICS: "diagnostics",
+        BACKGROUND: "background"
+        }
+
+
+class RequestScheduler(object):
+    """
+    Decides when each request goes down stack-ide's stdin.
+
+    stack-ide answers requests in the order it reads them, so a span query
+    written behind a session update and a source errors request waits for
+    both. Requests are therefore sorted into priority classes by tag:
+    interactive cursor queries, then diagnostics, then background work such
+    as session updates. Each class may only have so many requests in flight
+    at once, and a request over its class's limit waits here instead of in
+    the pipe. Diagnostics also wait while background requests are in
+    flight: source errors asked for mid-rebuild would be stale anyway. So
+    with the default limits a rebuild holds back further updates and
+    source error requests, but never a cursor query, which is written
+    behind at most the one update in progress.
+
+    At most max_in_flight requests are in flight overall. When that is what
+    holds requests back, the highest class goes first, except that a
+    request which has waited max_wait seconds goes ahead of younger ones of
+    any class, so a busy editor can't starve background work. Likewise a
+    diagnostics request which has waited max_wait seconds stops waiting for
+    background requests, as of the next request submitted or released.
+
+    transmit(seq, item, waited) is called, outside the scheduler's lock,
+    when a submitted request may be sent, with the seconds it was queued;
+    release(seq) must be called once it has been answered, failed or
+    abandoned.
+    """
+    CLASSES = {
+            "RequestGetExpTypes": INTERACTIVE,
+            "RequestGetSpanInfo": INTERACTIVE,
+            "RequestGetSourceErrors": DIAGNOSTICS,
+            "RequestUpdateSession": BACKGROUND,
+            "RequestGetLoadedModules": BACKGROUND
+            }
+    DEFAULT_CLASS = INTERACTIVE
+    LIMITS = {
+            INTERACTIVE: 64,
+            DIAGNOSTICS: 1,
+            BACKGROUND: 1
+            }
+    # Classes held back while any of the given classes has requests in
+    # flight.
+    WAITS_FOR = {
+            DIAGNOSTICS: (BACKGROUND,)
+            }
+
+    def __init__(self, transmit, limits=None, max_in_flight=64, max_wait=5.0, max_queued=1024):
+        self._transmit = transmit
+        self.limits = dict(self.LIMITS)
+        self.limits.update(limits or {})
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self.max_queued = max_queued
+        # class to deque of (queued at, seq, item)
+        self._queues = dict((cls, collections.deque()) for cls in CLASS_NAMES)
+        self._queued = 0
+        # seq to class of each request sent and not yet released
+        self._in_flight = {}
+        self._class_in_flight = collections.Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.promoted = 0
+
+
+    def classify(self, tag):
+        return self.CLASSES.get(tag, self.DEFAULT_CLASS)
+
+
+    def submit(self, seq, tag, item):
+        """
+        Queue a request, sending it straight away if its class has room.
+        Returns False, dropping it, if max_queued requests are waiting.
+        """
+        cls = self.classify(tag)
+        with self._lock:
+            if self._queued >= self.max_queued:
+                return False
+            self._queues[cls].append((time.monotonic(), seq, item))
+            self._queued += 1
+        self._pump()
+        return True
+
+
+    def release(self, seq):
+        """
+        Note that a request is no longer in flight, making room for another.
+        """
+        with self._lock:
+            cls = self._in_flight.pop(seq, None)
+            if cls is None:
+                return
+            self._class_in_flight[cls] -= 1
+        self._pump()
+
+
+    def drain(self):
+        """
+        Remove every queued request, returning a list of (seq, item).
+        """
+        with self._lock:
+            drained = [(seq, item) for cls in sorted(self._queues)
+                    for (_queued_at, seq, item) in self._queues[cls]]
+            for queue in self._queues.values():
+                queue.clear()
+            self._queued = 0
+        return drained
+
+
+    def queued_count(self):
+        return self._queued
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                    "queued": dict((CLASS_NAMES[cls], len(queue)) for (cls, queue) in self._queues.items()),
+                    "in_flight": dict((CLASS_NAMES[cls], self._class_in_flight[cls]) for cls in CLASS_NAMES),
+                    "promoted": self.promoted
+                    }
+
+
+    def _pump(self):
+        if getattr(self._local, "pumping", False):
+            # Released by transmit(): the loop below takes up the room.
+            return
+        self._local.pumping = True
+        try:
+            while True:
+                with self._lock:
+                    entry = self._next()
+                    if entry is None:
+                        return
+                    (cls, (queued_at, seq, item)) = entry
+                    self._in_flight[seq] = cls
+                    self._class_in_flight[cls] += 1
+                    self._queued -= 1
+                self._transmit(seq, item, time.monotonic() - queued_at)
+        finally:
+            self._local.pumping = False
+
+
+    def _next(self):
+        # Must be called with the lock held. Pops and returns (class, entry)
+        # for the request to send next, or None.
+        if len(self._in_flight) >= self.max_in_flight:
+            return None
+        now = time.monotonic()
+        ready = []
+        for (cls, queue) in sorted(self._queues.items()):
+            if not queue or self._class_in_flight[cls] >= self.limits[cls]:
+                continue
+            waiting = any(self._class_in_flight[other] for other in self.WAITS_FOR.get(cls, ()))
+            if waiting and now - queue[0][0] < self.max_wait:
+                continue
+            ready.append(cls)
+        if not ready:
+            return None
+        cls = ready[0]
+        oldest = min(ready, key=lambda c: self._queues[c][0][0])
+        if oldest != cls and now - self._queues[oldest][0][0] >= self.max_wait:
+            cls = oldest
+            self.promoted += 1
+        return (cls, self._queues[cls].popleft())
@@ -1,36 +1,105 @@
-import threading
+import concurrent.futures
+
+try:
+    from stack_ide.async_session import REQUEST_TIMEOUT, SESSION_DIED
+except ImportError:
+    from async_session import REQUEST_TIMEOUT, SESSION_DIED
+
+
+class RequestError(Exception):
+    """
+    Raised through a request's future when the request could not be completed.
+    """
+
+
+class RequestTimeout(RequestError):
+    """
+    Raised through a request's future when no response came in time.
+    """
+
 
 class Session(object):
+    """
+    Future based session for a given stack ide process.
+
+    Requests return immediately with a future. Handlers are still called with
+    each response as it arrives; the future resolves once the handler has
+    finished processing the request.
+
+    If stack-ide dies before a request completes, its future fails with a
+    RequestError, or a RequestTimeout if stack-ide doesn't answer in time;
+    the handler is not called.
+    """
     def __init__(self, async_session, debug):
         self._async_session = async_session
         self._debug = debug
 
 
+    @property
+    def pid(self):
+        return self._async_session.pid
+
+
+    @property
+    def stats(self):
+        return self._async_session.stats
+
+
+    def pending_count(self):
+        return self._async_session.pending_count()
+
+
+    def scheduler_stats(self):
+        return self._async_session.scheduler_stats()
+
+
+    def is_alive(self):
+        return self._async_session.is_alive()
+
+
+    def add_restart_listener(self, listener):
+        self._async_session.add_restart_listener(listener)
+
+
+    def end(self):
+        self._async_session.end()
+
+
     def send_request(self, tag, contents, handler=None):
-        event = threading.Event()
-        result = []
+        """
+        Send a request and return a future for its outcome.
+
+        Without a handler the future resolves to the final ``[tag, contents]``
+        response. With a handler it resolves to the handler's final return
+        value.
+        """
+        future = concurrent.futures.Future()
+        request_tag = tag
 
         def handle_cb(tag, contents):
+            if future.done():
+                # A response racing the request's timeout.
+                return 'done'
+            if tag == SESSION_DIED:
+                future.set_exception(RequestError("{0} failed: {1}".format(request_tag, contents)))
+                return 'done'
+            if tag == REQUEST_TIMEOUT:
+                future.set_exception(RequestTimeout(contents))
+                return 'done'
             if handler is None:
-                result.extend([[tag, contents]])
-                event.set()
+                future.set_result([tag, contents])
                 return 'done'
             try:
                 resp = handler(tag, contents)
-            except:
-                event.set()
+            except Exception as exc:
+                future.set_exception(exc)
                 raise
             else:
                 if resp != 'partial':
-                    # The handler has finished processing the response. We can
-                    # let the calling thread continue.
-                    event.set()
+                    # The handler has finished processing the response.
+                    future.set_result(resp)
                 return resp
 
-        if self._async_session.send_request(tag, contents, handle_cb):
-            event.wait()
-
-        if len(result) == 0:
-            return None
-        else:
-            return result[0]
+        if not self._async_session.send_request(tag, contents, handle_cb):
+            future.set_exception(RequestError("Couldn't send {0}".format(tag)))
+        return future
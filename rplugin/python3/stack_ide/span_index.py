@@ -0,0 +1,134 @@
+import bisect
+import threading
+
+
+class SpanIndex(object):
+    """
+    Per-file index of the expression types stack-ide has returned.
+
+    A RequestGetExpTypes response lists the types of every expression
+    enclosing the queried position, innermost first. Each innermost entry
+    remembers the positions it was the answer for, and a later query at one
+    of those positions is answered from the index, along with the other
+    indexed expressions enclosing it.
+
+    Other positions inside an innermost span aren't answered: the span may
+    hold smaller expressions which don't enclose the position first queried,
+    e.g. the x of (g x) after a query on its parenthesis.
+
+    Each file's entries are tied to the buffer changedtick they were returned
+    for; a lookup with a different changedtick drops them.
+    """
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+
+    def add(self, file_path, changedtick, position, types):
+        """
+        Add the ExpTypes of a response to a query at position, a (line,
+        column) tuple, innermost first.
+        """
+        if not types:
+            return
+        with self._lock:
+            index = self._files.get(file_path)
+            if index is None or index.changedtick != changedtick:
+                index = _FileSpanIndex(changedtick)
+                self._files[file_path] = index
+            index.add(types[0], [position])
+            for exp_type in types[1:]:
+                index.add(exp_type, [])
+
+
+    def export(self, file_path, changedtick):
+        """
+        Return [(ExpType, positions)] for file_path at changedtick, for
+        restore(); positions are those the ExpType was the innermost answer
+        for.
+        """
+        with self._lock:
+            index = self._files.get(file_path)
+            if index is None or index.changedtick != changedtick:
+                return []
+            return index.export()
+
+
+    def restore(self, file_path, changedtick, entries):
+        """
+        Add [(ExpType, positions)] from export().
+        """
+        with self._lock:
+            index = self._files.get(file_path)
+            if index is None or index.changedtick != changedtick:
+                index = _FileSpanIndex(changedtick)
+                self._files[file_path] = index
+            for (exp_type, positions) in entries:
+                index.add(exp_type, positions)
+
+
+    def lookup(self, file_path, line, column, changedtick):
+        """
+        Return the ExpTypes enclosing a position, innermost first, or None
+        if the index can't answer for it.
+        """
+        with self._lock:
+            index = self._files.get(file_path)
+            if index is None:
+                return None
+            if index.changedtick != changedtick:
+                del self._files[file_path]
+                return None
+            return index.lookup((line, column))
+
+
+    def invalidate(self):
+        """
+        Drop the entries for every file.
+        """
+        with self._lock:
+            self._files.clear()
+
+
+class _FileSpanIndex(object):
+    """
+    The spans of one file, sorted by start position.
+    """
+    def __init__(self, changedtick):
+        self.changedtick = changedtick
+        self._starts = []
+        self._entries = []
+        self._seen = {}
+
+
+    def add(self, exp_type, positions):
+        entry = self._seen.get(exp_type)
+        if entry is not None:
+            entry[2].update(positions)
+            return
+        start = exp_type.span.start
+        # [start, end, positions queried with this innermost, ExpType]
+        entry = [start, exp_type.span.end, set(positions), exp_type]
+        self._seen[exp_type] = entry
+        i = bisect.bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._entries.insert(i, entry)
+
+
+    def export(self):
+        return [(entry[3], sorted(entry[2])) for entry in self._entries]
+
+
+    def lookup(self, position):
+        # Spans end at an exclusive column.
+        enclosing = [entry for entry in self._entries[:bisect.bisect_right(self._starts, position)]
+                if position < entry[1]]
+        if not enclosing:
+            return None
+        # Nested spans: the innermost starts last and ends first.
+        enclosing.sort(key=lambda entry: (tuple(-n for n in entry[0]), entry[1]))
+        if position not in enclosing[0][2]:
+            # Never queried here: there may be a smaller expression
+            # enclosing it which we don't know about.
+            return None
+        return [entry[3] for entry in enclosing]
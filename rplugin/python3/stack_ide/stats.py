@@ -0,0 +1,157 @@
+import collections
+import threading
+import time
+
+
+class Histogram(object):
+    """
+    Rolling window of samples, reporting count and percentiles.
+    """
+    def __init__(self, size=1000):
+        self._samples = collections.deque(maxlen=size)
+        self.count = 0
+
+
+    def add(self, value):
+        self._samples.append(value)
+        self.count += 1
+
+
+    def summary(self):
+        samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count}
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+                "count": self.count,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": samples[-1]
+                }
+
+
+class RequestStats(object):
+    """
+    Latency and traffic statistics for one stack-ide session.
+
+    AsyncSession reports each request as it is sent and each response as it
+    arrives, keyed by seq; JsonStream reports bytes and the time spent
+    encoding and decoding. Per request tag this gives histograms of the time
+    to the first response and to the final response, and the number of
+    partial responses. Times are in seconds.
+    """
+    def __init__(self, window=1000):
+        self._window = window
+        self._lock = threading.Lock()
+        # seq to [tag, sent at, first response at]
+        self._in_flight = {}
+        self.first_response = collections.defaultdict(self._histogram)
+        self.latency = collections.defaultdict(self._histogram)
+        self.partials = collections.Counter()
+        self.timeouts = collections.Counter()
+        self.pending_depth = self._histogram()
+        self.timings = collections.defaultdict(self._histogram)
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.messages_in = 0
+
+
+    def _histogram(self):
+        return Histogram(self._window)
+
+
+    def request_sent(self, seq, tag, pending_depth):
+        with self._lock:
+            self._in_flight[seq] = [tag, time.monotonic(), None]
+            self.pending_depth.add(pending_depth)
+
+
+    def request_abandoned(self, seq):
+        with self._lock:
+            self._in_flight.pop(seq, None)
+
+
+    def request_timed_out(self, seq):
+        with self._lock:
+            entry = self._in_flight.pop(seq, None)
+            if entry is not None:
+                self.timeouts[entry[0]] += 1
+
+
+    def response_received(self, seq, final):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._in_flight.get(seq)
+            if entry is None:
+                return
+            [tag, sent_at, first_at] = entry
+            if first_at is None:
+                entry[2] = now
+                self.first_response[tag].add(now - sent_at)
+            if final:
+                del self._in_flight[seq]
+                self.latency[tag].add(now - sent_at)
+            else:
+                self.partials[tag] += 1
+
+
+    def encoded(self, nbytes, seconds):
+        with self._lock:
+            self.bytes_out += nbytes
+            self.messages_out += 1
+            self.timings["encode"].add(seconds)
+
+
+    def decoded(self, nbytes, seconds):
+        with self._lock:
+            self.bytes_in += nbytes
+            self.messages_in += 1
+            self.timings["decode"].add(seconds)
+
+
+    def timed(self, name, seconds):
+        """
+        Record a sample for any other named timing, e.g. handler run time.
+        """
+        with self._lock:
+            self.timings[name].add(seconds)
+
+
+    def snapshot(self):
+        """
+        Return the statistics as a JSON serialisable dict.
+        """
+        with self._lock:
+            return {
+                    "in_flight": len(self._in_flight),
+                    "pending_depth": self.pending_depth.summary(),
+                    "bytes_out": self.bytes_out,
+                    "bytes_in": self.bytes_in,
+                    "messages_out": self.messages_out,
+                    "messages_in": self.messages_in,
+                    "timings": dict((name, h.summary()) for name, h in self.timings.items()),
+                    "requests": dict(
+                        (tag, {
+                            "first_response": self.first_response[tag].summary(),
+                            "latency": self.latency[tag].summary(),
+                            "partials": self.partials[tag],
+                            "timeouts": self.timeouts[tag]
+                            })
+                        for tag in set(self.latency) | set(self.timeouts))
+                    }
+
+
+def format_summary(summary):
+    """
+    Format a Histogram summary of seconds as milliseconds.
+    """
+    if "p50" not in summary:
+        return "n={0}".format(summary["count"])
+    return "n={count} p50={p50:.1f} p95={p95:.1f} p99={p99:.1f} max={max:.1f} ms".format(
+            count=summary["count"],
+            **dict((k, summary[k] * 1000) for k in ("p50", "p95", "p99", "max")))
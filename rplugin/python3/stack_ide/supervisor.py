@@ -0,0 +1,68 @@
+import threading
+import time
+
+
+class Supervisor(object):
+    """
+    Restarts a stack-ide process which exits without being asked to.
+
+    When the process dies, requests that were sent too long ago to be replayed
+    within replay_deadline seconds are failed at once. The process is then
+    restarted after a delay which doubles with each consecutive crash, up to
+    max_backoff seconds. Once it is back the session state is sent again and
+    the remaining in-flight requests are replayed.
+
+    A process which stays up for stable_after seconds has its crash count
+    reset. After max_restarts consecutive crashes the supervisor gives up
+    and every pending request is failed.
+    """
+    def __init__(self, debug, max_restarts=5, backoff=0.5, max_backoff=30.0,
+            replay_deadline=10.0, stable_after=60.0):
+        self._debug = debug
+        self.max_restarts = max_restarts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.replay_deadline = replay_deadline
+        self.stable_after = stable_after
+        self._crashes = 0
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+
+    def process_exited(self, session, returncode):
+        """
+        Called with the AsyncSession whose process exited unexpectedly.
+        """
+        with self._lock:
+            if time.monotonic() - self._started_at > self.stable_after:
+                self._crashes = 0
+            if self._crashes >= self.max_restarts:
+                self._debug.error("+ stack-ide exited with status {0} after {1} restarts; giving up".format(
+                    returncode, self._crashes))
+                session.give_up("stack-ide exited with status {0}".format(returncode))
+                return
+            delay = min(self.backoff * 2 ** self._crashes, self.max_backoff)
+            self._crashes += 1
+
+        self._debug.warning("+ stack-ide exited with status {0}; restarting in {1:.1f}s".format(
+            returncode, delay))
+        # Requests which can't be replayed in time shouldn't wait for the restart.
+        session.fail_pending("stack-ide exited with status {0}".format(returncode),
+                older_than=self.replay_deadline - delay)
+        timer = threading.Timer(delay, self._restart, args=(session,))
+        timer.daemon = True
+        timer.start()
+
+
+    def _restart(self, session):
+        with self._lock:
+            self._started_at = time.monotonic()
+        try:
+            if not session.restart():
+                # Ended while we were waiting.
+                return
+        except OSError as exc:
+            self._debug.error("+ Couldn't restart stack-ide: {0}".format(exc))
+            self.process_exited(session, None)
+            return
+        session.replay_pending(self.replay_deadline)
@@ -0,0 +1,99 @@
+import concurrent.futures
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rplugin", "python3", "stack_ide"))
+
+from buffer_sync import BufferSync
+from debug_log import DebugLog
+
+
+class FakeBuffer(list):
+    def __init__(self, number, name, lines, project_root="/project"):
+        list.__init__(self, lines)
+        self.number = number
+        self.name = name
+        self.vars = {"stack_ide_project_root": project_root} if project_root else {}
+
+
+class FakeVim(object):
+    def __init__(self, buffers):
+        self.buffers = buffers
+        self.session = self
+
+
+    def threadsafe_call(self, fn):
+        # The tests flush by hand; ignore the debounce timer.
+        pass
+
+
+class FakeApi(object):
+    """
+    Records each RequestUpdateSession, which stays in flight until finish().
+    """
+    def __init__(self):
+        self.requests = []
+
+
+    def update_session(self, updates, handler=None):
+        future = concurrent.futures.Future()
+        self.requests.append((updates, future))
+        return future
+
+
+    def finish(self, index):
+        self.requests[index][1].set_result(None)
+
+
+    def contents(self, index):
+        return [update["contents"] for update in self.requests[index][0]]
+
+
+class FlushTest(unittest.TestCase):
+    def setUp(self):
+        self.a = FakeBuffer(1, "/project/src/A.hs", ["a = 1"])
+        self.b = FakeBuffer(2, "/project/src/B.hs", ["b = 1"])
+        self.api = FakeApi()
+        self.sync = BufferSync(FakeVim([self.a, self.b]), DebugLog(), lambda buffer: self.api, None)
+
+
+    def change(self, buffer, changedtick, line):
+        buffer[0] = line
+        self.sync.buffer_changed(buffer.number, changedtick)
+        self.sync.flush()
+
+
+    def test_updates_parked_while_syncing(self):
+        self.change(self.a, 2, "a = 2")
+        self.change(self.a, 3, "a = 3")
+        self.change(self.b, 2, "b = 2")
+        self.change(self.a, 4, "a = 4")
+        self.assertEqual(len(self.api.requests), 1)
+        self.api.finish(0)
+        self.assertEqual(len(self.api.requests), 2)
+        self.assertEqual(self.api.contents(1),
+                [["src/A.hs", "a = 4\n"], ["src/B.hs", "b = 2\n"]])
+        self.api.finish(1)
+        self.change(self.b, 3, "b = 3")
+        self.assertEqual(len(self.api.requests), 3)
+
+
+    def test_unloaded_buffer_replaces_parked_contents(self):
+        self.change(self.a, 2, "a = 2")
+        self.change(self.a, 3, "a = 3")
+        self.sync.buffer_unloaded(self.a.number)
+        self.api.finish(0)
+        self.assertEqual(self.api.contents(1), ["src/A.hs"])
+
+
+    def test_uninitialised_buffer_skipped(self):
+        c = FakeBuffer(3, "/tmp/C.hs", ["c = 1"], project_root=None)
+        self.sync._vim.buffers.append(c)
+        self.sync.buffer_changed(c.number, 2)
+        self.change(self.a, 2, "a = 2")
+        self.assertEqual(self.api.contents(0), [["src/A.hs", "a = 2\n"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rplugin", "python3", "stack_ide"))
+
+from cli import parse_jsonl
+
+
+class ParseJsonlTest(unittest.TestCase):
+    def parse(self, *lines):
+        return list(parse_jsonl(io.StringIO("\n".join(lines) + "\n"), ["exp-types"]))
+
+
+    def test_queries(self):
+        [exp_types, span_info] = self.parse(
+                '{"file": "src/A.hs", "line": 1, "column": 2}',
+                '',
+                '{"file": "src/A.hs", "line": 3, "column": 4, "end_line": 3, "end_column": 9, "query": "span-info"}')
+        self.assertEqual(exp_types, {"query": "exp-types", "file": "src/A.hs",
+            "line": 1, "column": 2, "end_line": 1, "end_column": 3})
+        self.assertEqual(span_info, {"query": "span-info", "file": "src/A.hs",
+            "line": 3, "column": 4, "end_line": 3, "end_column": 9})
+
+
+    def test_bad_lines_give_errors(self):
+        records = self.parse(
+                '{"file": "src/A.hs", "line": 1, "column": 2, "query": "bogus"}',
+                'not json',
+                '{"line": 1}',
+                '{"file": "src/A.hs", "line": 1, "column": 2}')
+        self.assertEqual([record.get("input_line") for record in records], [1, 2, 3, None])
+        self.assertIn("bogus", records[0]["error"])
+        self.assertNotIn("error", records[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
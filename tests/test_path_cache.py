@@ -0,0 +1,83 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rplugin", "python3", "stack_ide"))
+
+from debug_log import DebugLog
+from path_cache import StackPathCache
+
+
+class FakeStack(object):
+    """
+    Answers `stack path` from the nearest stack.yaml, counting the calls.
+    """
+    def __init__(self):
+        self.calls = []
+
+
+    def __call__(self, path_type, cwd):
+        self.calls.append((path_type, cwd))
+        path = cwd
+        while not os.path.isfile(os.path.join(path, "stack.yaml")):
+            path = os.path.dirname(path)
+        if path_type == "project-root":
+            return path
+        return os.path.join(path, "stack.yaml")
+
+
+class LookupTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for directory in ["src/A", "src/B", "sub/src"]:
+            os.makedirs(os.path.join(self.root, directory))
+        self.touch("stack.yaml")
+        self.touch("pkg.cabal")
+        self.stack = FakeStack()
+        self.cache = StackPathCache(self.stack, DebugLog(),
+                cache_file=os.path.join(self.root, "cache", "stack-paths.json"))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+    def touch(self, path):
+        with open(os.path.join(self.root, path), "w"):
+            pass
+
+
+    def lookup(self, directory):
+        return self.cache.lookup(os.path.join(self.root, directory))
+
+
+    def test_only_first_directory_runs_stack(self):
+        expected = (self.root, os.path.join(self.root, "stack.yaml"))
+        self.assertEqual(self.lookup("src/A"), expected)
+        self.assertEqual(self.lookup("src/B"), expected)
+        self.assertEqual(self.lookup("sub/src"), expected)
+        self.assertEqual(len(self.stack.calls), 2)
+
+
+    def test_nested_project_runs_stack(self):
+        self.touch("sub/stack.yaml")
+        self.lookup("src/A")
+        self.assertEqual(self.lookup("sub/src"),
+                (os.path.join(self.root, "sub"), os.path.join(self.root, "sub", "stack.yaml")))
+        self.assertEqual(len(self.stack.calls), 4)
+
+
+    def test_directory_outside_project_runs_stack(self):
+        self.lookup("src/A")
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+        with open(os.path.join(other, "stack.yaml"), "w"):
+            pass
+        self.assertEqual(self.cache.lookup(other), (other, os.path.join(other, "stack.yaml")))
+        self.assertEqual(len(self.stack.calls), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rplugin", "python3", "stack_ide"))
+
+from pending import PendingRequests
+
+
+class ExpiryTest(unittest.TestCase):
+    TIMEOUT = 0.05
+
+    def setUp(self):
+        self.expired = []
+        self.expired_event = threading.Event()
+        self.pending = PendingRequests(self.on_expired, max_in_flight=4,
+                timeouts={"RequestUpdateSession": self.TIMEOUT * 4}, default_timeout=self.TIMEOUT)
+        self.addCleanup(self.pending.close)
+
+
+    def on_expired(self, seq, entry):
+        self.expired.append((seq, entry.request["tag"]))
+        self.expired_event.set()
+
+
+    def add(self, seq, tag="RequestGetExpTypes"):
+        return self.pending.add(seq, {"tag": tag, "seq": seq}, None)
+
+
+    def wait_for_expiry(self):
+        self.assertTrue(self.expired_event.wait(2))
+        self.expired_event.clear()
+
+
+    def test_expires_unanswered(self):
+        self.add(1)
+        self.add(2)
+        self.pending.pop(2)
+        self.wait_for_expiry()
+        time.sleep(self.TIMEOUT)
+        self.assertEqual(self.expired, [(1, "RequestGetExpTypes")])
+        self.assertIsNone(self.pending.get(1))
+        self.assertEqual(len(self.pending), 0)
+
+
+    def test_timeout_by_tag(self):
+        self.add(1, "RequestUpdateSession")
+        self.add(2)
+        self.wait_for_expiry()
+        self.assertEqual(self.expired, [(2, "RequestGetExpTypes")])
+        self.wait_for_expiry()
+        self.assertEqual(self.expired, [(2, "RequestGetExpTypes"), (1, "RequestUpdateSession")])
+
+
+    def test_refresh_restarts_deadline(self):
+        self.add(1)
+        started = time.monotonic()
+        for _ in range(4):
+            time.sleep(self.TIMEOUT / 2)
+            self.pending.refresh(1)
+        self.assertEqual(self.expired, [])
+        self.wait_for_expiry()
+        self.assertGreaterEqual(time.monotonic() - started, self.TIMEOUT * 2.5)
+        self.assertEqual(self.expired, [(1, "RequestGetExpTypes")])
+
+
+    def test_earlier_deadline_wakes_timer(self):
+        self.add(1, "RequestUpdateSession")
+        # Let the timer thread go to sleep until the long deadline.
+        time.sleep(self.TIMEOUT / 5)
+        started = time.monotonic()
+        self.add(2)
+        self.wait_for_expiry()
+        self.assertLess(time.monotonic() - started, self.TIMEOUT * 3)
+        self.assertEqual(self.expired, [(2, "RequestGetExpTypes")])
+
+
+    def test_max_in_flight(self):
+        for seq in range(4):
+            self.assertTrue(self.add(seq))
+        self.assertFalse(self.add(4))
+        self.pending.pop(0)
+        self.assertTrue(self.add(4))
+
+
+    def test_close_stops_expiry(self):
+        self.add(1)
+        self.pending.close()
+        time.sleep(self.TIMEOUT * 2)
+        self.assertEqual(self.expired, [])
+        self.assertIsNotNone(self.pending.get(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rplugin", "python3", "stack_ide"))
+
+from debug_log import DebugLog
+from diagnostics import Diagnostic
+from plugin import SourceErrorsHandler, StackIdePlugin
+
+
+class FakeVim(object):
+    def __init__(self, loaded=()):
+        self.vars = {}
+        self.output = []
+        self.loaded = list(loaded)
+        self.calls = []
+        self.api = self
+        self.session = self
+
+
+    def out_write(self, msg):
+        self.output.append(msg)
+
+
+    def eval(self, expr):
+        return self.loaded
+
+
+    def call_atomic(self, calls):
+        self.calls.extend(calls)
+        return [[{"id": 1} for _call in calls], None]
+
+
+    def threadsafe_call(self, fn):
+        fn()
+
+
+    def called(self, function):
+        """
+        Return the arguments of each call_atomic call of function.
+        """
+        return [args for (_name, [name, args]) in self.calls if name == function]
+
+
+class FakeApi(object):
+    """
+    Just enough of StackIdeApi for the SessionPool.
+    """
+    def __init__(self, pid):
+        self.pid = pid
+        self.ended = False
+
+
+    def is_alive(self):
+        return not self.ended
+
+
+    def is_idle(self):
+        return True
+
+
+    def pending_count(self):
+        return 2
+
+
+    def end(self):
+        self.ended = True
+
+
+class StatusTest(unittest.TestCase):
+    def setUp(self):
+        self.vim = FakeVim()
+        self.plugin = StackIdePlugin(self.vim)
+        self.plugin.pool._boot = lambda project_root, targets, stack_yaml: FakeApi(os.getpid())
+
+
+    def test_no_sessions(self):
+        self.plugin.stack_ide_status()
+        self.assertEqual(self.vim.output, ["No stack-ide sessions running\n"])
+
+
+    def test_live_session(self):
+        self.plugin.pool.get("/project", "pkg:lib", "/project/stack.yaml")
+        self.plugin.stack_ide_status()
+        [report] = self.vim.output
+        self.assertRegex(report, r"^/project pkg:lib: pid {0}, \d+ MB, idle 0s, 2 pending\n$".format(
+            os.getpid()))
+
+
+    def test_rss_unknown(self):
+        self.plugin.pool._boot = lambda project_root, targets, stack_yaml: FakeApi(None)
+        self.plugin.pool.get("/project", ("pkg:lib", "pkg:exe:app"), "/project/stack.yaml")
+        self.plugin.stack_ide_status()
+        [report] = self.vim.output
+        self.assertEqual(report, "/project pkg:lib pkg:exe:app: pid None, RSS unknown, idle 0s, 2 pending\n")
+
+
+class SourceErrorsTest(unittest.TestCase):
+    A = Diagnostic("KindError", "src/A.hs", 3, 1, 3, 5, "A is broken")
+    B = Diagnostic("KindWarning", "src/B.hs", 7, 1, 7, 2, "B is suspect")
+
+    def setUp(self):
+        self.vim = FakeVim(loaded=["/project/src/A.hs"])
+        self.handler = SourceErrorsHandler(self.vim, DebugLog(), "/project")
+
+
+    def placed(self):
+        return [(sign["buffer"], sign["lnum"])
+                for [signs] in self.vim.called("sign_placelist") for sign in signs]
+
+
+    def test_signs_placed_when_buffer_loaded(self):
+        self.handler.show("pkg:lib", [self.A, self.B])
+        self.assertEqual(self.placed(), [("/project/src/A.hs", 3)])
+        self.handler.buffer_loaded("/project/src/B.hs")
+        self.assertEqual(self.placed(), [("/project/src/A.hs", 3), ("/project/src/B.hs", 7)])
+
+
+    def test_reloaded_buffer_keeps_sign_ids(self):
+        self.handler.show("pkg:lib", [self.A])
+        self.handler.buffer_loaded("/project/src/A.hs")
+        [[[first]], [[second]]] = self.vim.called("sign_placelist")
+        self.assertEqual(first["id"], second["id"])
+
+
+    def test_drop_session(self):
+        self.handler.show("pkg:lib", [self.A])
+        self.handler.show("pkg:exe:app", [self.B])
+        self.handler.drop_session("pkg:lib")
+        self.assertEqual(self.handler.diagnostics.diagnostics, [self.B])
+        [[[unplaced]]] = self.vim.called("sign_unplacelist")
+        self.assertEqual(unplaced["buffer"], "/project/src/A.hs")
+        [_set, _replace, what] = self.vim.called("setqflist")[-1]
+        self.assertEqual([item["text"] for item in what["items"]], ["B is suspect"])
+
+
+    def test_evicted_session_errors_dropped(self):
+        plugin = StackIdePlugin(self.vim)
+        plugin.pool._boot = lambda project_root, targets, stack_yaml: FakeApi(None)
+        plugin.pool.max_sessions = 1
+        plugin._source_errors_handlers["/project"] = self.handler
+        plugin.pool.get("/project", "pkg:lib", "/project/stack.yaml")
+        self.handler.show("pkg:lib", [self.A])
+        plugin.pool.get("/project", "pkg:exe:app", "/project/stack.yaml")
+        self.assertEqual(self.handler.diagnostics.diagnostics, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rplugin", "python3", "stack_ide"))
+
+from project import ProjectIndex, parse_cabal_file
+
+
+CABAL_FILE = """\
+name:                example
+version:             0.1.0.0
+-- A comment: with a colon
+build-type:          Simple
+
+library
+  hs-source-dirs:      src
+  exposed-modules:     Example
+  if flag(extra)
+    hs-source-dirs:    extra
+
+Executable example-exe
+  main-is:             Main.hs
+  hs-source-dirs:
+      app
+    , shared
+  build-depends:       base
+
+test-suite spec
+  type:                exitcode-stdio-1.0
+  hs-source-dirs:      test, src
+  main-is:             Spec.hs
+
+benchmark bench
+  hs-source-dirs:      bench
+  main-is:             Bench.hs
+"""
+
+
+class TempProject(object):
+    def __init__(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+
+
+    def write(self, path, text):
+        path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+
+    def remove(self):
+        shutil.rmtree(self.root)
+
+
+class ParseCabalFileTest(unittest.TestCase):
+    def setUp(self):
+        self.project = TempProject()
+        self.addCleanup(self.project.remove)
+
+
+    def test_components(self):
+        cabal_file = self.project.write("example.cabal", CABAL_FILE)
+        (package_name, components) = parse_cabal_file(cabal_file)
+        self.assertEqual(package_name, "example")
+        self.assertEqual(components, [
+            ("library", "", ["src", "extra"]),
+            ("executable", "example-exe", ["app", "shared"]),
+            ("test-suite", "spec", ["test", "src"]),
+            ("benchmark", "bench", ["bench"])
+            ])
+
+
+    def test_default_source_dir(self):
+        cabal_file = self.project.write("example.cabal", "Name: example\n\nexecutable example\n  main-is: Main.hs\n")
+        self.assertEqual(parse_cabal_file(cabal_file), ("example", [("executable", "example", ["."])]))
+
+
+    def test_missing_file(self):
+        self.assertEqual(parse_cabal_file(self.project.path("missing.cabal")), (None, []))
+
+
+class TargetForTest(unittest.TestCase):
+    def setUp(self):
+        self.project = TempProject()
+        self.addCleanup(self.project.remove)
+        self.stack_yaml = self.project.write("stack.yaml", "resolver: lts-9.0\npackages:\n- '.'\n- other\n")
+        self.project.write("example.cabal", CABAL_FILE)
+        self.project.write("other/other.cabal", "name: other\n\nlibrary\n  hs-source-dirs: src\n")
+        self.index = ProjectIndex(self.project.root, self.stack_yaml)
+
+
+    def target_for(self, *parts):
+        return self.index.target_for(self.project.path(*parts))
+
+
+    def test_targets(self):
+        self.assertEqual(self.target_for("src", "Example.hs"), "example:lib")
+        self.assertEqual(self.target_for("extra", "Extra.hs"), "example:lib")
+        self.assertEqual(self.target_for("app", "Main.hs"), "example:exe:example-exe")
+        self.assertEqual(self.target_for("test", "Spec.hs"), "example:test:spec")
+        self.assertEqual(self.target_for("bench", "Bench.hs"), "example:bench:bench")
+        self.assertEqual(self.target_for("other", "src", "Other.hs"), "other:lib")
+
+
+    def test_shared_directory_prefers_library(self):
+        self.assertEqual(self.target_for("src", "Example", "Internal.hs"), "example:lib")
+
+
+    def test_nested_package_wins(self):
+        # other/ is inside the package directory of example, and its own
+        # package is the longer match.
+        self.assertEqual(self.target_for("other", "Setup.hs"), "other")
+
+
+    def test_outside_source_dirs(self):
+        self.assertEqual(self.target_for("Setup.hs"), "example")
+
+
+    def test_outside_project(self):
+        self.assertIsNone(self.index.target_for(os.path.join(os.path.dirname(self.project.root), "A.hs")))
+
+
+    def test_source_dir_prefix_is_not_a_match(self):
+        self.assertEqual(self.target_for("srcs", "A.hs"), "example")
+
+
+    def test_stale(self):
+        self.assertFalse(self.index.is_stale())
+        os.utime(self.stack_yaml, (0, 0))
+        self.assertTrue(self.index.is_stale())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rplugin", "python3", "stack_ide"))
+
+from debug_log import DebugLog
+from records import ExpType, SourceSpan
+from result_store import ResultStore
+from span_index import SpanIndex
+
+
+def exp_type(type_string, from_column, to_column):
+    return ExpType(type_string, SourceSpan("src/A.hs", 1, 1, from_column, to_column))
+
+
+class RoundTripTest(unittest.TestCase):
+    """
+    r = f (g x), queried on the parenthesis.
+    """
+    PARENS = exp_type("Bool", 7, 12)
+    WHOLE = exp_type("Int", 5, 12)
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        index = SpanIndex()
+        index.add("src/A.hs", 1, (1, 7), [self.PARENS, self.WHOLE])
+        store = self._store()
+        store.update("src/A.hs", "hash", index.export("src/A.hs", 1), [])
+        store.save()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+
+    def _store(self):
+        return ResultStore("/project", "pkg:lib", DebugLog(), cache_dir=self.cache_dir)
+
+
+    def test_restored_index_answers_only_queried_positions(self):
+        (exp_types, _span_infos) = self._store().lookup("src/A.hs", "hash")
+        index = SpanIndex()
+        index.restore("src/A.hs", 5, exp_types)
+        self.assertEqual(index.lookup("src/A.hs", 1, 7, 5), [self.PARENS, self.WHOLE])
+        self.assertIsNone(index.lookup("src/A.hs", 1, 10, 5))
+
+
+    def test_changed_contents_are_thrown_away(self):
+        store = self._store()
+        self.assertIsNone(store.lookup("src/A.hs", "other hash"))
+        self.assertIsNone(store.lookup("src/A.hs", "hash"))
+
+
+if __name__ == '__main__':
+    unittest.main()
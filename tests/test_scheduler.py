@@ -0,0 +1,150 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rplugin", "python3", "stack_ide"))
+
+from scheduler import RequestScheduler
+
+
+class SchedulerTest(unittest.TestCase):
+    MAX_WAIT = 0.05
+
+    def setUp(self):
+        self.sent = []
+        self.scheduler = self.make_scheduler()
+
+
+    def make_scheduler(self, **kwargs):
+        kwargs.setdefault("max_wait", self.MAX_WAIT)
+        return RequestScheduler(lambda seq, item, waited: self.sent.append(seq), **kwargs)
+
+
+    def submit(self, seq, tag):
+        return self.scheduler.submit(seq, tag, {"tag": tag})
+
+
+    def age(self):
+        time.sleep(self.MAX_WAIT * 1.5)
+
+
+    def test_class_limit(self):
+        for seq in range(3):
+            self.submit(seq, "RequestUpdateSession")
+        self.assertEqual(self.sent, [0])
+        self.scheduler.release(0)
+        self.assertEqual(self.sent, [0, 1])
+        self.assertEqual(self.scheduler.queued_count(), 1)
+
+
+    def test_interactive_not_held_back(self):
+        self.submit(1, "RequestUpdateSession")
+        self.submit(2, "RequestGetLoadedModules")
+        for seq in range(3, 6):
+            self.submit(seq, "RequestGetExpTypes")
+        self.submit(6, "RequestGetSpanInfo")
+        self.assertEqual(self.sent, [1, 3, 4, 5, 6])
+
+
+    def test_limits_override(self):
+        self.scheduler = self.make_scheduler(limits={RequestScheduler.CLASSES["RequestUpdateSession"]: 2})
+        for seq in range(3):
+            self.submit(seq, "RequestUpdateSession")
+        self.assertEqual(self.sent, [0, 1])
+
+
+    def test_diagnostics_wait_for_background(self):
+        self.submit(1, "RequestUpdateSession")
+        self.submit(2, "RequestGetSourceErrors")
+        self.submit(3, "RequestUpdateSession")
+        self.assertEqual(self.sent, [1])
+        self.scheduler.release(1)
+        # Diagnostics go first once nothing holds them back, so they are
+        # answered before the next update starts.
+        self.assertEqual(self.sent, [1, 2, 3])
+        self.submit(4, "RequestGetSourceErrors")
+        self.scheduler.release(2)
+        self.assertEqual(self.sent, [1, 2, 3])
+
+
+    def test_diagnostics_without_background(self):
+        self.submit(1, "RequestGetSourceErrors")
+        self.submit(2, "RequestGetSourceErrors")
+        self.assertEqual(self.sent, [1])
+
+
+    def test_diagnostics_stop_waiting_after_max_wait(self):
+        self.submit(1, "RequestUpdateSession")
+        self.submit(2, "RequestGetSourceErrors")
+        self.age()
+        self.assertEqual(self.sent, [1])
+        # Nothing is sent until the scheduler next runs.
+        self.submit(3, "RequestGetExpTypes")
+        self.assertEqual(self.sent, [1, 2, 3])
+
+
+    def test_priority_when_saturated(self):
+        self.scheduler = self.make_scheduler(max_in_flight=1, max_wait=60)
+        self.submit(1, "RequestGetExpTypes")
+        self.submit(2, "RequestUpdateSession")
+        self.submit(3, "RequestGetSpanInfo")
+        self.scheduler.release(1)
+        self.assertEqual(self.sent, [1, 3])
+        self.assertEqual(self.scheduler.stats()["promoted"], 0)
+
+
+    def test_promotion_prevents_starvation(self):
+        self.scheduler = self.make_scheduler(max_in_flight=1)
+        self.submit(1, "RequestGetExpTypes")
+        self.submit(2, "RequestUpdateSession")
+        self.age()
+        self.submit(3, "RequestGetSpanInfo")
+        self.scheduler.release(1)
+        self.assertEqual(self.sent, [1, 2])
+        self.assertEqual(self.scheduler.stats()["promoted"], 1)
+        self.scheduler.release(2)
+        self.assertEqual(self.sent, [1, 2, 3])
+
+
+    def test_release_from_transmit(self):
+        def transmit(seq, item, waited):
+            self.sent.append(seq)
+            # E.g. a request failing as it is written.
+            self.scheduler.release(seq)
+        self.scheduler = RequestScheduler(transmit)
+        for seq in range(3):
+            self.submit(seq, "RequestUpdateSession")
+        self.assertEqual(self.sent, [0, 1, 2])
+        self.assertEqual(self.scheduler.stats()["in_flight"]["background"], 0)
+
+
+    def test_release_unknown_seq(self):
+        self.submit(1, "RequestUpdateSession")
+        self.scheduler.release(1)
+        self.scheduler.release(1)
+        self.scheduler.release(99)
+        self.assertEqual(self.scheduler.stats()["in_flight"]["background"], 0)
+
+
+    def test_max_queued(self):
+        self.scheduler = self.make_scheduler(max_queued=2)
+        self.assertTrue(self.submit(1, "RequestUpdateSession"))
+        self.assertTrue(self.submit(2, "RequestUpdateSession"))
+        self.assertTrue(self.submit(3, "RequestUpdateSession"))
+        self.assertFalse(self.submit(4, "RequestUpdateSession"))
+        self.assertEqual(self.sent, [1])
+
+
+    def test_drain(self):
+        self.submit(1, "RequestUpdateSession")
+        self.submit(2, "RequestUpdateSession")
+        self.submit(3, "RequestGetSourceErrors")
+        self.assertEqual([seq for (seq, _item) in self.scheduler.drain()], [3, 2])
+        self.assertEqual(self.scheduler.queued_count(), 0)
+        self.scheduler.release(1)
+        self.assertEqual(self.sent, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
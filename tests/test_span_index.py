@@ -0,0 +1,61 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rplugin", "python3", "stack_ide"))
+
+from records import ExpType, SourceSpan
+from span_index import SpanIndex
+
+
+def exp_type(type_string, from_column, to_column, line=1):
+    return ExpType(type_string, SourceSpan("src/A.hs", line, line, from_column, to_column))
+
+
+class NestedSpanTest(unittest.TestCase):
+    """
+    r = f (g x)
+    1234567890123
+    """
+    WHOLE = exp_type("Int", 5, 12)          # f (g x)
+    PARENS = exp_type("Bool", 7, 12)        # (g x)
+    APPLICATION = exp_type("Bool", 8, 11)   # g x
+    X = exp_type("Char", 10, 11)            # x
+
+    def setUp(self):
+        self.index = SpanIndex()
+        # Query on the parenthesis, whose innermost expression is (g x).
+        self.index.add("src/A.hs", 1, (1, 7), [self.PARENS, self.WHOLE])
+
+
+    def test_queried_position_is_answered(self):
+        self.assertEqual(self.index.lookup("src/A.hs", 1, 7, 1), [self.PARENS, self.WHOLE])
+
+
+    def test_nested_position_is_not_answered(self):
+        # x is inside (g x), but so are g x and x itself.
+        self.assertIsNone(self.index.lookup("src/A.hs", 1, 10, 1))
+
+
+    def test_nested_answer_is_complete(self):
+        self.index.add("src/A.hs", 1, (1, 10), [self.X, self.APPLICATION, self.PARENS, self.WHOLE])
+        self.assertEqual(self.index.lookup("src/A.hs", 1, 10, 1),
+                [self.X, self.APPLICATION, self.PARENS, self.WHOLE])
+        # g is still unknown.
+        self.assertIsNone(self.index.lookup("src/A.hs", 1, 8, 1))
+
+
+    def test_space_between_arguments(self):
+        # foo bar: a query on the space only tells us about the application.
+        index = SpanIndex()
+        application = exp_type("Int", 1, 8, line=2)
+        index.add("src/A.hs", 1, (2, 4), [application])
+        self.assertIsNone(index.lookup("src/A.hs", 2, 5, 1))
+
+
+    def test_other_changedtick_is_not_answered(self):
+        self.assertIsNone(self.index.lookup("src/A.hs", 1, 7, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()